@@ -0,0 +1,77 @@
+"""Per-sweep time of the dense ccd kernel, column major versus the former row major kernel.
+
+The reference kernel is the previous implementation of firls.ccd._cycle, which reads the
+columns of a C ordered design with a stride of p and updates the residual in two passes.
+
+    python benchmarks/bench_ccd_layout.py
+"""
+
+import time
+
+import numpy as np
+from numba import njit
+
+from firls.ccd import _cycle, soft_threshold
+
+
+@njit(fastmath=True)
+def _cycle_row_major(beta, h, active_set, XtX, sum_sq_X, lambda_l1, lambda_l2):
+    for j in active_set:
+        beta_j_old = beta[j, 0]
+        h += beta_j_old * XtX[:, j]
+        rho = XtX[:, j].T @ h
+        beta_j_new = soft_threshold(rho, lambda_l1) / (sum_sq_X[j] + lambda_l2)
+        h -= beta_j_new * XtX[:, j]
+        beta[j, 0] = beta_j_new
+    return beta
+
+
+@njit
+def sweeps_row_major(X, y, sum_sq_X, lambda_l1, n_sweeps):
+    n, p = X.shape
+    beta, h = np.zeros((p, 1)), y.copy()
+    active_set = list(range(p))
+    for _ in range(n_sweeps):
+        _cycle_row_major(beta, h, active_set, X, sum_sq_X, lambda_l1, 0.0)
+    return beta
+
+
+@njit
+def sweeps_column_major(X, y, sum_sq_X, lambda_l1, n_sweeps):
+    n, p = X.shape
+    beta, h = np.zeros((p, 1)), y.copy()
+    active_set = list(range(p))
+    Xty = np.empty((1, 1))
+    for _ in range(n_sweeps):
+        _cycle(beta, h, active_set, None, Xty, X, 0.0, sum_sq_X, lambda_l1, 0.0)
+    return beta
+
+
+def time_sweeps(n, p, n_sweeps, lambda_l1=0.0):
+    np.random.seed(1234)
+    X = np.random.normal(size=(n, p))
+    y = X @ np.random.normal(size=p) + np.random.normal(size=n)
+    sum_sq_X = np.sum(X ** 2, 0)
+
+    timings = []
+    for sweeps, X_layout in [
+        (sweeps_row_major, np.ascontiguousarray(X)),
+        (sweeps_column_major, np.asfortranarray(X)),
+    ]:
+        beta = sweeps(X_layout, y, sum_sq_X, lambda_l1, 1)
+        start = time.perf_counter()
+        beta_sweeps = sweeps(X_layout, y, sum_sq_X, lambda_l1, n_sweeps)
+        timings.append((time.perf_counter() - start) / n_sweeps)
+    return timings
+
+
+if __name__ == "__main__":
+    print("{:>16} {:>10} {:>16} {:>16} {:>8}".format("shape", "lambda_l1", "row major (ms)", "col major (ms)", "speedup"))
+    for n, p, n_sweeps in [(200000, 20, 10), (20000, 200, 10), (1000, 2000, 10), (200, 5000, 20)]:
+        for lambda_l1 in [0.0, 10.0]:
+            row_major, col_major = time_sweeps(n, p, n_sweeps, lambda_l1)
+            print(
+                "{:>16} {:>10} {:>16.2f} {:>16.2f} {:>8.1f}".format(
+                    "{}x{}".format(n, p), lambda_l1, row_major * 1e3, col_major * 1e3, row_major / col_major
+                )
+            )
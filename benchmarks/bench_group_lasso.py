@@ -0,0 +1,60 @@
+"""Scalar ccd versus block coordinate descent on correlated feature groups.
+
+Every group holds noisy copies of one latent feature, like overlapping spline bases. The same
+ridge problem is solved by solver="ccd" and by solver="bcd" through GLM(groups=...), then the
+group lasso and the sparse group lasso are fitted with "bcd".
+
+    python benchmarks/bench_group_lasso.py --n 100000 --groups 20 --size 5
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from firls.sklearn import GLM
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=100000)
+    parser.add_argument("--groups", type=int, default=20)
+    parser.add_argument("--size", type=int, default=5)
+    parser.add_argument("--noise", type=float, default=0.1)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(1234)
+    latent = rng.normal(size=(args.n, args.groups))
+    X = np.repeat(latent, args.size, axis=1) + args.noise * rng.normal(
+        size=(args.n, args.groups * args.size)
+    )
+    groups = np.repeat(np.arange(args.groups), args.size)
+    beta = np.zeros(args.groups * args.size)
+    beta[: args.size * args.groups // 4] = rng.normal(scale=0.1, size=args.size * args.groups // 4)
+    y = rng.poisson(np.exp(X @ beta)) * 1.0
+
+    print(
+        "{:>20} {:>8} {:>10} {:>10} {:>10} {:>14}".format(
+            "penalty", "solver", "irls", "sweeps", "time", "zero groups"
+        )
+    )
+    fits = [
+        ("ridge", "ccd", dict(lambda_l2=1.0, solver="ccd")),
+        ("ridge", "bcd", dict(lambda_l2=1.0, groups=groups)),
+        ("group lasso", "bcd", dict(lambda_group=100.0, groups=groups)),
+        ("sparse group lasso", "bcd", dict(lambda_l1=20.0, lambda_group=100.0, groups=groups)),
+    ]
+    for penalty, solver, params in fits:
+        start = time.perf_counter()
+        glm = GLM(family="poisson", max_iters=100000, **params).fit(X, y)
+        elapsed = time.perf_counter() - start
+        zero_groups = np.sum(np.all(glm.coef_.reshape((args.groups, args.size)) == 0, axis=1))
+        print(
+            "{:>20} {:>8} {:>10} {:>10} {:>10.3f} {:>14}".format(
+                penalty, solver, glm.irls_niter_, glm.ccd_niter_, elapsed, zero_groups
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Many small glm, one per group: fit_grouped versus a Python loop over GLM.fit.
+
+    python benchmarks/bench_grouped.py --groups 10000 --rows 200 --p 5
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from firls import fit_grouped
+from firls.sklearn import GLM
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--groups", type=int, default=10000)
+    parser.add_argument("--rows", type=int, default=200)
+    parser.add_argument("--p", type=int, default=5)
+    parser.add_argument("--loop-groups", type=int, default=500)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(1234)
+    n = args.groups * args.rows
+    groups = rng.randint(args.groups, size=n)
+    X = rng.normal(size=(n, args.p))
+    beta = rng.normal(scale=0.3, size=(args.groups, args.p))
+    eta = np.einsum("ij,ij->i", X, beta[groups])
+    targets = {
+        "poisson": rng.poisson(np.exp(eta)) * 1.0,
+        "binomial": (rng.uniform(size=n) < 1 / (1 + np.exp(-eta))) * 1.0,
+    }
+
+    # compile outside of the timings
+    fit_grouped(X[:100], targets["poisson"][:100], groups[:100], family="poisson")
+
+    print("{:>10} {:>16} {:>16} {:>8}".format("family", "grouped model/s", "loop model/s", "speedup"))
+    for family, y in targets.items():
+        start = time.perf_counter()
+        fit_grouped(X, y, groups, family=family, lambda_l2=1e-3)
+        grouped = args.groups / (time.perf_counter() - start)
+
+        masks = [groups == g for g in range(args.loop_groups)]
+        start = time.perf_counter()
+        for mask in masks:
+            GLM(family=family, lambda_l2=1e-3, solver="inv").fit(X[mask], y[mask])
+        loop = args.loop_groups / (time.perf_counter() - start)
+        print("{:>10} {:>16.0f} {:>16.0f} {:>8.1f}".format(family, grouped, loop, grouped / loop))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Load test of the micro-batching scoring server on one machine.
+
+Starts the HTTP server in process, sends requests from concurrent keep-alive clients and
+prints the client side p50/p99 latencies and throughput, the server side statistics, and
+the cost of one single-row predict call for reference.
+
+    python benchmarks/bench_serving.py --clients 64 --requests 200
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+
+from firls.serving import ScoringService
+from firls.sklearn import GLM
+from firls.tests.simulate import simulate_supervised_poisson
+
+
+async def client(port, rows, latencies):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    for x in rows:
+        body = json.dumps({"x": x.tolist()}).encode()
+        start = time.perf_counter()
+        writer.write(
+            "POST /predict HTTP/1.1\r\nContent-Length: {}\r\n\r\n".format(len(body)).encode()
+            + body
+        )
+        await reader.readline()
+        length = 0
+        while True:
+            line = await reader.readline()
+            if not line.strip():
+                break
+            if line.lower().startswith(b"content-length"):
+                length = int(line.split(b":")[1])
+        await reader.readexactly(length)
+        latencies.append(time.perf_counter() - start)
+    writer.close()
+
+
+async def load_test(model, X, n_clients, n_requests, max_batch_size, max_latency):
+    service = ScoringService(model, max_batch_size=max_batch_size, max_latency=max_latency)
+    server = await service.start_server(port=0)
+    port = server.sockets[0].getsockname()[1]
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(
+        *[
+            client(port, X[np.random.randint(len(X), size=n_requests)], latencies)
+            for _ in range(n_clients)
+        ]
+    )
+    elapsed = time.perf_counter() - start
+    stats = service.stats()
+    server.close()
+    await server.wait_closed()
+    await service.stop()
+    return np.array(latencies), elapsed, stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--features", type=int, default=50)
+    parser.add_argument("--max-batch-size", type=int, default=256)
+    parser.add_argument("--max-latency", type=float, default=0.002)
+    args = parser.parse_args()
+
+    y, X, true_beta = simulate_supervised_poisson(10000, args.features)
+    model = GLM(family="poisson", fit_intercept=True).fit(X, y)
+
+    start = time.perf_counter()
+    for x in X[:1000]:
+        model.predict(x.reshape(1, -1))
+    print("single-row predict: {:.1f} us/call".format((time.perf_counter() - start) * 1e3))
+
+    loop = asyncio.new_event_loop()
+    latencies, elapsed, stats = loop.run_until_complete(
+        load_test(
+            model, X, args.clients, args.requests, args.max_batch_size, args.max_latency
+        )
+    )
+    loop.close()
+    print(
+        "client: {} requests, p50 {:.2f} ms, p99 {:.2f} ms, {:.0f} requests/s".format(
+            len(latencies),
+            np.percentile(latencies, 50) * 1e3,
+            np.percentile(latencies, 99) * 1e3,
+            len(latencies) / elapsed,
+        )
+    )
+    print(
+        "server: p50 {:.2f} ms, p99 {:.2f} ms, {:.0f} requests/s, mean batch size {:.1f}".format(
+            stats["p50_latency"] * 1e3,
+            stats["p99_latency"] * 1e3,
+            stats["throughput"],
+            stats["mean_batch_size"],
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Exact "inv" irls versus the "sketch" solver on tall problems.
+
+The sketch solver runs the irls on sketch_size rows sampled once, then finishes with exact
+steps on all the rows. The sketched phase is timed alone to give its cost per iteration.
+
+    python benchmarks/bench_sketch.py --n 1000000 --p 50
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from firls.cost_model import default_sketch_size
+from firls.irls import sketched_irls
+from firls.sklearn import GLM
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=1000000)
+    parser.add_argument("--p", type=int, default=50)
+    parser.add_argument("--sketch-size", type=int, default=None)
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--coef-scale", type=float, default=0.3)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(1234)
+    X = np.asfortranarray(rng.normal(size=(args.n, args.p)))
+    beta = rng.normal(scale=args.coef_scale, size=args.p)
+    targets = {
+        "poisson": rng.poisson(np.exp(X @ beta)) * 1.0,
+        "binomial": (rng.uniform(size=args.n) < 1 / (1 + np.exp(-X @ beta))) * 1.0,
+    }
+    sketch_size = args.sketch_size or default_sketch_size(args.n, args.p)
+
+    print(
+        "{:>10} {:>8} {:>6} {:>10} {:>14} {:>16}".format(
+            "family", "solver", "irls", "time", "time/iter", "max |coef diff|"
+        )
+    )
+    for family, y in targets.items():
+        fits = {}
+        for solver in ["inv", "sketch"]:
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                glm = GLM(
+                    family=family, solver=solver, sketch_size=sketch_size, random_state=0
+                ).fit(X, y)
+                times.append(time.perf_counter() - start)
+            fits[solver] = glm
+            print(
+                "{:>10} {:>8} {:>6} {:>10.3f} {:>14.4f} {:>16.2e}".format(
+                    family,
+                    solver,
+                    glm.irls_niter_,
+                    min(times),
+                    min(times) / glm.irls_niter_,
+                    np.max(np.abs(glm.coef_ - fits["inv"].coef_)),
+                )
+            )
+
+        mu = (y.reshape(-1, 1) + np.mean(y)) / 2
+        w = np.zeros((args.p + 1, 1))
+        start = time.perf_counter()
+        w, niter = sketched_irls(
+            X, y.reshape(-1, 1), family, True, 0.0, 1.0, 1e-25, mu, w, sketch_size, 100
+        )
+        elapsed = time.perf_counter() - start
+        print(
+            "{:>10} {:>8} {:>6} {:>10.3f} {:>14.4f}  (sampling pass included)".format(
+                family, "sketched", niter, elapsed, elapsed / niter
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
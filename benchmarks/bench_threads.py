@@ -0,0 +1,37 @@
+"""Scaling of a single large GLM fit with the number of threads.
+
+    python benchmarks/bench_threads.py --n 2000000 --p 20
+"""
+
+import argparse
+import time
+
+from numba import config
+
+from firls.sklearn import GLM
+from firls.tests.simulate import simulate_supervised_poisson
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=2000000)
+    parser.add_argument("--p", type=int, default=20)
+    parser.add_argument("--solvers", default="inv,ccd,ccd_gram")
+    args = parser.parse_args()
+
+    y, X, true_beta = simulate_supervised_poisson(args.n, args.p)
+    threads = sorted({1, 2, 4, 8, 16, 32, config.NUMBA_NUM_THREADS} & set(range(1, config.NUMBA_NUM_THREADS + 1)))
+    print("{:>10} {:>10} {:>10} {:>8}".format("solver", "n_threads", "time (s)", "speedup"))
+    for solver in args.solvers.split(","):
+        GLM(family="poisson", solver=solver).fit(X[:100], y[:100])
+        reference = None
+        for n_threads in threads:
+            start = time.perf_counter()
+            GLM(family="poisson", solver=solver, n_threads=n_threads).fit(X, y)
+            elapsed = time.perf_counter() - start
+            reference = elapsed if reference is None else reference
+            print("{:>10} {:>10} {:>10.2f} {:>8.2f}".format(solver, n_threads, elapsed, reference / elapsed))
+
+
+if __name__ == "__main__":
+    main()
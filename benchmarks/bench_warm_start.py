@@ -0,0 +1,74 @@
+"""Cold versus warm started refits on a simulated drift scenario.
+
+Every day the true coefficients drift slightly and the model is refitted on the new data,
+either from scratch or from the previous day solution (warm_start=True).
+
+    python benchmarks/bench_warm_start.py --n 200000 --p 50 --days 5
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from firls.sklearn import GLM
+
+
+def simulate_day(rng, X, beta, family, r=1.0):
+    mu = np.exp(X @ beta)
+    if family == "poisson":
+        return rng.poisson(mu) * 1.0
+    return rng.negative_binomial(r, r / (mu + r)) * 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=200000)
+    parser.add_argument("--p", type=int, default=50)
+    parser.add_argument("--days", type=int, default=5)
+    parser.add_argument("--drift", type=float, default=0.01)
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(1234)
+    print(
+        "{:>16} {:>8} {:>10} {:>12} {:>12} {:>10} {:>10}".format(
+            "family", "solver", "lambda_l1", "irls cold", "irls warm", "ccd cold", "ccd warm"
+        )
+        + " {:>10} {:>10}".format("time cold", "time warm")
+    )
+    for family in ["poisson", "negativebinomial"]:
+        for solver, lambda_l1 in [("inv", None), ("ccd", None), ("ccd", 10.0)]:
+            beta = np.round(rng.normal(scale=0.1, size=args.p), 2)
+            X = rng.normal(size=(args.n, args.p))
+            warm = GLM(family=family, solver=solver, lambda_l1=lambda_l1, warm_start=True)
+            warm.fit(X, simulate_day(rng, X, beta, family))
+            stats = np.zeros(6)
+            for day in range(args.days):
+                beta = beta + rng.normal(scale=args.drift, size=args.p)
+                X = rng.normal(size=(args.n, args.p))
+                y = simulate_day(rng, X, beta, family)
+
+                start = time.perf_counter()
+                cold = GLM(family=family, solver=solver, lambda_l1=lambda_l1).fit(X, y)
+                time_cold = time.perf_counter() - start
+                start = time.perf_counter()
+                warm.fit(X, y)
+                time_warm = time.perf_counter() - start
+                stats += [
+                    cold.irls_niter_,
+                    warm.irls_niter_,
+                    cold.ccd_niter_,
+                    warm.ccd_niter_,
+                    time_cold,
+                    time_warm,
+                ]
+            stats /= args.days
+            print(
+                "{:>16} {:>8} {:>10} {:>12.1f} {:>12.1f} {:>10.1f} {:>10.1f} {:>10.3f} {:>10.3f}".format(
+                    family, solver, str(lambda_l1), *stats
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
 from firls.sklearn import SparseGLM, GLM
+from firls.grouped import fit_grouped
 
-__all__ = ["SparseGLM", "GLM"]
+__all__ = ["SparseGLM", "GLM", "fit_grouped"]
@@ -0,0 +1,201 @@
+"""Cost model for the automatic selection of the irls solver.
+
+The time of one irls iteration is estimated for each solver from the problem shape, the
+penalties, the cores and two machine rates: the flop rate of the BLAS matrix products and
+the per thread flop rate of the streaming loops. The BLAS products and the O(n) kernels
+(weights, linear predictor, deviance and design copies) run over the cores, the ccd sweeps
+are single threaded. The rates default to conservative constants and can be measured once
+with calibrate(), which stores them on disk for the next fits with the number of cores
+used; fewer cores scale the calibrated BLAS rate down.
+"""
+
+import json
+import os
+import time
+
+import numpy as np
+
+
+# Default machine rates in flop/s when no calibration is stored.
+DEFAULT_BLAS_FLOPS_PER_CORE = 1e10
+DEFAULT_STREAM_FLOPS = 1e9
+# Expected number of ccd sweeps per irls iteration with warm started inexact inner solves.
+SWEEPS_PER_IRLS = 4
+# Expected number of irls iterations of the exact solvers, and of the sketch solver split
+# into sketched and exact iterations.
+EXACT_IRLS_ITERS = 6
+SKETCH_IRLS_ITERS = 6
+SKETCH_EXACT_IRLS_ITERS = 3
+
+
+def _n_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def default_sketch_size(n, p):
+    """Default number of rows sampled by the sketch solver, about 2% of the rows."""
+    return max(1000, 20 * p, n // 50)
+
+
+def default_calibration_path():
+    """Path of the stored calibration, FIRLS_CALIBRATION or ~/.cache/firls/calibration.json."""
+    return os.environ.get(
+        "FIRLS_CALIBRATION",
+        os.path.join(os.path.expanduser("~"), ".cache", "firls", "calibration.json"),
+    )
+
+
+def load_calibration(path=None):
+    """Returns the stored machine rates, or None when the machine was not calibrated."""
+    path = default_calibration_path() if path is None else path
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+
+def calibrate(path=None, n=20000, p=100, repeat=3):
+    """Measure the machine rates with a micro-benchmark of a few seconds and store them on disk.
+
+    Returns the calibration dictionary.
+    """
+    from firls.ccd import ccd_pwls
+
+    rng = np.random.RandomState(0)
+    X = rng.normal(size=(n, p))
+    y = rng.normal(size=(n, 1))
+    W = np.ones((n, 1))
+
+    X.T @ X
+    start = time.perf_counter()
+    for _ in range(repeat):
+        X.T @ X
+    blas_flops = 2.0 * n * p ** 2 * repeat / (time.perf_counter() - start)
+
+    n_sweeps = 10
+    ccd_pwls(X, y, W, None, False, 0.0, 0.0, None, None, 1, 0.0)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        ccd_pwls(X, y, W, None, False, 0.0, 0.0, None, None, n_sweeps, 0.0)
+    stream_flops = (n_sweeps * 4.0 + 1.0) * n * p * repeat / (time.perf_counter() - start)
+
+    calibration = {
+        "blas_flops": blas_flops,
+        "stream_flops": stream_flops,
+        "n_cores": _n_cores(),
+    }
+    path = default_calibration_path() if path is None else path
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path, "w") as f:
+        json.dump(calibration, f)
+    return calibration
+
+
+def estimate_costs(
+    n,
+    p,
+    fit_intercept=True,
+    lambda_l1=0.0,
+    bounds=None,
+    family="binomial",
+    itemsize=8,
+    sketch_size=None,
+    n_cores=None,
+    calibration=None,
+):
+    """Estimated fit time in seconds of each solver allowed for the problem.
+
+    n_cores is the number of threads of the fit, default to the available cores.
+    """
+    q = p + int(fit_intercept)
+    n_cores = _n_cores() if n_cores is None else n_cores
+    if calibration is not None:
+        calibrated_cores = calibration.get("n_cores", n_cores)
+        n_cores = min(n_cores, calibrated_cores)
+        blas = calibration["blas_flops"] * n_cores / calibrated_cores
+        stream = calibration["stream_flops"]
+    else:
+        blas = DEFAULT_BLAS_FLOPS_PER_CORE * n_cores
+        stream = DEFAULT_STREAM_FLOPS
+    parallel_stream = stream * n_cores
+    # the kernels run in float64, other dtypes pay one conversion pass
+    convert = 0.0 if itemsize == 8 else n * p / stream
+
+    # weights, working response and linear predictor, common to every solver
+    common = 4.0 * n * q / parallel_stream
+    # the weighted design copies run over the cores, the ccd sweeps do not
+    inv = common + 2.0 * n * q / parallel_stream + (2.0 * n * q ** 2 + q ** 3) / blas
+    ccd = common + n * q / parallel_stream + SWEEPS_PER_IRLS * 4.0 * n * q / stream
+    ccd_gram = (
+        common
+        + n * q / parallel_stream
+        + 2.0 * n * q ** 2 / blas
+        + SWEEPS_PER_IRLS * 2.0 * q ** 2 / stream
+    )
+
+    n_iters = 1 if family == "gaussian" else EXACT_IRLS_ITERS
+    costs = {
+        "ccd": convert + n_iters * ccd,
+        "ccd_gram": convert + n_iters * ccd_gram,
+    }
+    if lambda_l1 == 0.0 and bounds is None:
+        costs["inv"] = convert + n_iters * inv
+        m = default_sketch_size(n, p) if sketch_size is None else sketch_size
+        if family != "gaussian" and q <= m < n:
+            # one full pass draws the sample, the sketched iterations only touch its m rows
+            sampling = 2.0 * n * q / stream + m * q / stream
+            sketch = 6.0 * m * q / stream + (2.0 * m * q ** 2 + q ** 3) / blas
+            costs["sketch"] = (
+                convert
+                + sampling
+                + SKETCH_IRLS_ITERS * sketch
+                + common
+                + SKETCH_EXACT_IRLS_ITERS * inv
+            )
+    return costs
+
+
+def select_solver(
+    n,
+    p,
+    fit_intercept=True,
+    lambda_l1=0.0,
+    bounds=None,
+    family="binomial",
+    itemsize=8,
+    sketch_size=None,
+    n_cores=None,
+    calibration=None,
+):
+    """Select the solver with the lowest estimated fit time.
+
+    Returns the solver name and a string with the reason of the choice.
+    """
+    costs = estimate_costs(
+        n,
+        p,
+        fit_intercept=fit_intercept,
+        lambda_l1=lambda_l1,
+        bounds=bounds,
+        family=family,
+        itemsize=itemsize,
+        sketch_size=sketch_size,
+        n_cores=n_cores,
+        calibration=calibration,
+    )
+    solver = min(costs, key=costs.get)
+    reason = "n={}, p={}, {}{}estimated fit time {} ({} rates)".format(
+        n,
+        p,
+        "lambda_l1>0, " if lambda_l1 > 0.0 else "",
+        "bounds, " if bounds is not None else "",
+        ", ".join("{}={:.2e}s".format(k, v) for k, v in sorted(costs.items(), key=lambda kv: kv[1])),
+        "calibrated" if calibration is not None else "default",
+    )
+    return solver, reason
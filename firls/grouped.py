@@ -0,0 +1,213 @@
+"""Fit many small glm, one per group, in a single compiled kernel."""
+
+from numba import njit, prange
+import numpy as np
+
+from firls.irls import (
+    MAX_STEP_HALVING,
+    VALID_FAMILY,
+    _family_code,
+    _unit_deviance,
+    _weight_and_response,
+)
+
+
+@njit("boolean(float64[:,:],float64[:],float64[:])")
+def _cholesky_solve(A, b, x):
+    """Solve A x = b in place for a small symmetric positive definite A. Returns False when A is not
+    positive definite. A is overwritten by its Cholesky factor.
+    """
+    q = A.shape[0]
+    for j in range(q):
+        s = A[j, j]
+        for k in range(j):
+            s -= A[j, k] ** 2
+        if not s > 0.0:
+            return False
+        A[j, j] = s ** 0.5
+        for i in range(j + 1, q):
+            s = A[i, j]
+            for k in range(j):
+                s -= A[i, k] * A[j, k]
+            A[i, j] = s / A[j, j]
+    for i in range(q):
+        s = b[i]
+        for k in range(i):
+            s -= A[i, k] * x[k]
+        x[i] = s / A[i, i]
+    for i in range(q - 1, -1, -1):
+        s = x[i]
+        for k in range(i + 1, q):
+            s -= A[k, i] * x[k]
+        x[i] = s / A[i, i]
+    return True
+
+
+@njit("float64(float64[:,:],float64[:],float64[:],float64[:],int64,boolean,float64,float64,float64)")
+def _objective(X, y, w, mu, family_code, fit_intercept, lambda_l2, r, p_shrinkage):
+    """Update mu from w and returns the penalized deviance of one group."""
+    n, p = X.shape
+    offset = fit_intercept * 1
+    dev = 0.0
+    for i in range(n):
+        eta = w[0] if fit_intercept else 0.0
+        for j in range(p):
+            eta += X[i, j] * w[j + offset]
+        mu[i] = eta if family_code == 0 else np.exp(eta)
+        dev += _unit_deviance(y[i], mu[i], family_code, r, p_shrinkage)
+    pen = 0.0
+    for j in range(offset, p + offset):
+        pen += w[j] ** 2
+    return 0.5 * dev + 0.5 * lambda_l2 * pen
+
+
+@njit(
+    "int64(float64[:,:],float64[:],int64,boolean,float64,float64,int64,float64,float64,float64[:])"
+)
+def _fit_group(X, y, family_code, fit_intercept, lambda_l2, r, max_iters, tol, p_shrinkage, w):
+    """Irls with exact Newton steps for one group. Writes the weights in w and returns the number of
+    iterations. The weights are nan when the weighted Gram matrix is singular.
+    """
+    n, p = X.shape
+    offset = fit_intercept * 1
+    q = p + offset
+    mu = (y + np.mean(y)) / 2
+    w[:] = 0.0
+    w_old = np.zeros(q)
+    gram = np.empty((q, q))
+    rhs = np.empty(q)
+    x = np.empty(q)
+    x[0] = 1.0
+    obj_old = np.inf
+
+    for irls_niter in range(max_iters):
+        gram[:, :] = 0.0
+        rhs[:] = 0.0
+        for i in range(n):
+            W_i, z_i = _weight_and_response(y[i], mu[i], family_code, r, p_shrinkage)
+            for j in range(p):
+                x[j + offset] = X[i, j]
+            for a in range(q):
+                wx_a = W_i * x[a]
+                rhs[a] += wx_a * z_i
+                for b in range(a + 1):
+                    gram[a, b] += wx_a * x[b]
+        for a in range(offset, q):
+            gram[a, a] += lambda_l2
+        if not _cholesky_solve(gram, rhs, w):
+            w[:] = np.nan
+            return irls_niter + 1
+        if family_code == 0:
+            return 1
+
+        obj = _objective(X, y, w, mu, family_code, fit_intercept, lambda_l2, r, p_shrinkage)
+        for _ in range(MAX_STEP_HALVING):
+            if obj <= obj_old:
+                break
+            w[:] = (w + w_old) / 2
+            obj = _objective(X, y, w, mu, family_code, fit_intercept, lambda_l2, r, p_shrinkage)
+
+        if abs(obj - obj_old) / (abs(obj) + 0.1) < tol:
+            return irls_niter + 1
+        obj_old = obj
+        w_old[:] = w
+    return max_iters
+
+
+@njit(
+    "Tuple((float64[:,:],int64[:]))(float64[:,:],float64[:],int64[:],unicode_type,boolean,float64,float64,int64,float64,float64)",
+    parallel=True,
+)
+def fit_irls_grouped(X, y, offsets, family, fit_intercept, lambda_l2, r, max_iters, tol, p_shrinkage):
+    """Fit one glm per group of consecutive rows X[offsets[g]:offsets[g + 1]], in parallel over the groups.
+
+    Returns the stacked weights, the intercept first when fit_intercept is True, and the number of irls
+    iterations of each group.
+    """
+    n, p = X.shape
+    n_groups = len(offsets) - 1
+    family_code = _family_code(family)
+    coef = np.empty((n_groups, p + fit_intercept * 1))
+    n_iter = np.empty(n_groups, dtype=np.int64)
+    for g in prange(n_groups):
+        start, end = offsets[g], offsets[g + 1]
+        n_iter[g] = _fit_group(
+            X[start:end],
+            y[start:end],
+            family_code,
+            fit_intercept,
+            lambda_l2,
+            r,
+            max_iters,
+            tol,
+            p_shrinkage,
+            coef[g],
+        )
+    return coef, n_iter
+
+
+def fit_grouped(
+    X,
+    y,
+    groups,
+    family="binomial",
+    fit_intercept=True,
+    lambda_l2=None,
+    r=1,
+    max_iters=100,
+    tol=1e-8,
+    p_shrinkage=1e-25,
+):
+    """Fit one glm per group with a single compiled kernel, in parallel over the groups.
+
+    The rows are sorted by group once, then every group is fitted by irls with exact Newton steps.
+    This avoids the Python overhead of one GLM.fit per group when there are many small groups.
+
+    Parameters
+    ----------
+    X : array
+        data
+
+    y : array
+        target
+
+    groups : array
+        Group label of each row.
+
+    family, fit_intercept, lambda_l2, r, max_iters, tol, p_shrinkage :
+        See GLM. The norm 1 penalty and the bounds are not supported.
+
+    Returns
+    -------
+    Returns the sorted unique group labels, the coefficients stacked by group with shape
+    (n_groups, p), the intercepts with shape (n_groups,) and the number of irls iterations of each
+    group. The coefficients of a group with a singular design are nan.
+
+    """
+    if family not in VALID_FAMILY:
+        raise ValueError("'family' must be in " + repr(VALID_FAMILY))
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64).ravel()
+    groups = np.asarray(groups).ravel()
+    if X.ndim != 2 or X.shape[0] != y.shape[0] or X.shape[0] != groups.shape[0]:
+        raise ValueError("X, y and groups must have the same number of rows")
+
+    order = np.argsort(groups, kind="mergesort")
+    labels, starts = np.unique(groups[order], return_index=True)
+    offsets = np.append(starts, len(groups)).astype(np.int64)
+
+    coef, n_iter = fit_irls_grouped(
+        np.ascontiguousarray(X[order]),
+        np.ascontiguousarray(y[order]),
+        offsets,
+        family,
+        fit_intercept,
+        float(lambda_l2) if lambda_l2 is not None else 0.0,
+        float(r),
+        int(max_iters),
+        float(tol),
+        float(p_shrinkage),
+    )
+    if fit_intercept:
+        return labels, coef[:, 1:], coef[:, 0], n_iter
+    return labels, coef, np.zeros(len(labels)), n_iter
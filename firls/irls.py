@@ -1,46 +1,302 @@
 """Solve glm with separable constraint using irls method."""
 
 
-from numba import njit
+from numba import njit, prange
 from numba.types import float64, int64, unicode_type, boolean, Tuple, optional
 import numpy as np
-from firls.ccd import ccd_pwls, add_constant
+from firls.ccd import ccd_pwls, ccd_gram_pwls, bcd_pwls, _to_fortran, _group_index
 
+# Loosest tolerance given to the inner ccd solver in the inexact Newton schedule.
+INNER_TOL_MAX = 1e-2
+# Maximum number of step halvings when an irls step increases the objective.
+MAX_STEP_HALVING = 30
+# Relative change of the objective under which the sketch solver switches to exact irls steps.
+SKETCH_SWITCH_TOL = 1e-4
+
+
+VALID_FAMILY = ["gaussian", "binomial", "bernoulli", "poisson", "negativebinomial"]
 
-@njit(
-    "float64[:,:](float64[:,:],float64[:,:],unicode_type,float64,float64,float64[:,:])"
-)
-def get_W_and_z(X, y, family, r, p_shrinkage, mu):
-    n, p = X.shape
 
+@njit("int64(unicode_type)")
+def _family_code(family):
+    """Index of the family in VALID_FAMILY, so that the row kernels do not compare strings. -1 if unknown."""
     if family == "gaussian":
-        z = y
-        W = np.ones((n, 1))
-    elif family == "negativebinomial":
-        r_plus_y = r + y
-        eta = np.log(mu)
-        prob = np.minimum(np.maximum(p_shrinkage, mu / (mu + r)), 1 - p_shrinkage)
-        W = r_plus_y * (prob * (1 - prob))
-        z = eta + (mu + r) ** 2 * y / (r_plus_y * mu * r) - (mu + r) / r
+        return 0
     elif family == "binomial":
-        eta = np.log(mu)
-        prob = r * np.minimum(np.maximum(p_shrinkage, mu / (mu + 1)), 1 - p_shrinkage)
-        W = prob * (r - prob)
-        z = eta + r * (y - prob) / W
+        return 1
     elif family == "bernoulli":
-        eta = np.log(mu)
-        prob = np.minimum(np.maximum(p_shrinkage, mu / (mu + 1)), 1 - p_shrinkage)
-        W = prob * (1 - prob)
-        z = eta + (y - prob) / W
+        return 2
     elif family == "poisson":
-        eta = np.log(mu)
-        W = mu
-        z = eta + (y - mu) / W
-    return np.column_stack((W, z))
+        return 3
+    elif family == "negativebinomial":
+        return 4
+    return -1
+
+
+@njit("UniTuple(float64, 2)(float64,float64,int64,float64,float64)", error_model="numpy")
+def _weight_and_response(y_i, mu_i, family_code, r, p_shrinkage):
+    """Working weight and response of the irls for one row."""
+    if family_code == 0:
+        return 1.0, y_i
+    elif family_code == 1:
+        prob = r * min(max(p_shrinkage, mu_i / (mu_i + 1)), 1 - p_shrinkage)
+        W_i = prob * (r - prob)
+        return W_i, np.log(mu_i) + r * (y_i - prob) / W_i
+    elif family_code == 2:
+        prob = min(max(p_shrinkage, mu_i / (mu_i + 1)), 1 - p_shrinkage)
+        W_i = prob * (1 - prob)
+        return W_i, np.log(mu_i) + (y_i - prob) / W_i
+    elif family_code == 3:
+        return mu_i, np.log(mu_i) + (y_i - mu_i) / mu_i
+    elif family_code == 4:
+        prob = min(max(p_shrinkage, mu_i / (mu_i + r)), 1 - p_shrinkage)
+        W_i = (r + y_i) * (prob * (1 - prob))
+        return (
+            W_i,
+            np.log(mu_i) + (mu_i + r) ** 2 * y_i / ((r + y_i) * mu_i * r) - (mu_i + r) / r,
+        )
+    return np.nan, np.nan
+
+
+@njit("float64(float64,float64)", error_model="numpy")
+def _y_log_y_over_mu(y_i, mu_i):
+    """Compute y * log(y / mu) with the convention 0 * log(0) = 0."""
+    return y_i * np.log(y_i / mu_i) if y_i > 0 else 0.0
+
+
+@njit("float64(float64,float64,int64,float64,float64)", error_model="numpy")
+def _unit_deviance(y_i, mu_i, family_code, r, p_shrinkage):
+    """Deviance of one row. mu is the inverse of the log link (the odds for the binomial families)."""
+    if family_code == 0:
+        return (y_i - mu_i) ** 2
+    elif family_code == 1:
+        prob = min(max(p_shrinkage, mu_i / (mu_i + 1)), 1 - p_shrinkage)
+        return 2 * (_y_log_y_over_mu(y_i, r * prob) + _y_log_y_over_mu(r - y_i, r * (1 - prob)))
+    elif family_code == 2:
+        prob = min(max(p_shrinkage, mu_i / (mu_i + 1)), 1 - p_shrinkage)
+        return -2 * (y_i * np.log(prob) + (1 - y_i) * np.log(1 - prob))
+    elif family_code == 3:
+        return 2 * (_y_log_y_over_mu(y_i, mu_i) - (y_i - mu_i))
+    elif family_code == 4:
+        return 2 * (_y_log_y_over_mu(y_i, mu_i) - _y_log_y_over_mu(y_i + r, mu_i + r))
+    return np.nan
 
 
 @njit(
-    "Tuple((float64[:,:],int64,int64))(float64[:,:],float64[:,:],unicode_type,boolean,float64,float64,optional(float64[:,:]),float64,int64, float64, float64,unicode_type)"
+    "float64[:,:](float64[:,:],float64[:,:],unicode_type,float64,float64,float64[:,:])",
+    parallel=True,
+)
+def get_W_and_z(X, y, family, r, p_shrinkage, mu):
+    """Working weights and response of the irls, computed in parallel over the rows."""
+    n = y.shape[0]
+    family_code = _family_code(family)
+    Wz = np.empty((n, 2))
+    for i in prange(n):
+        W_i, z_i = _weight_and_response(y[i, 0], mu[i, 0], family_code, r, p_shrinkage)
+        Wz[i, 0] = W_i
+        Wz[i, 1] = z_i
+    return Wz
+
+
+@njit("float64(float64[:,:],float64[:,:],unicode_type,float64,float64)", parallel=True)
+def deviance(y, mu, family, r, p_shrinkage):
+    """Deviance of the glm family, computed in parallel over the rows."""
+    n = y.shape[0]
+    family_code = _family_code(family)
+    dev = 0.0
+    for i in prange(n):
+        dev += _unit_deviance(y[i, 0], mu[i, 0], family_code, r, p_shrinkage)
+    return dev
+
+
+@njit("float64[:,:](float64[:,:],float64[:,:],boolean)", parallel=True, fastmath=True)
+def _inverse_link(X, w, fit_intercept):
+    """exp(X w + c) computed in parallel over the rows."""
+    n, p = X.shape
+    offset = fit_intercept * 1
+    intercept = w[0, 0] if fit_intercept else 0.0
+    mu = np.empty((n, 1))
+    for i in prange(n):
+        eta = intercept
+        for j in range(p):
+            eta += X[i, j] * w[j + offset, 0]
+        mu[i, 0] = np.exp(eta)
+    return mu
+
+
+@njit("float64(float64[:,:],boolean,float64,float64,float64,int64[:])")
+def _penalty(w, fit_intercept, lambda_l1, lambda_l2, lambda_group, groups):
+    pen = 0.0
+    if lambda_group > 0.0:
+        singles, members, offsets = _group_index(groups, fit_intercept)
+        for g in range(len(offsets) - 1):
+            m = offsets[g + 1] - offsets[g]
+            sq = 0.0
+            for k in range(offsets[g], offsets[g + 1]):
+                sq += w[members[k], 0] ** 2
+            pen += lambda_group * m ** 0.5 * sq ** 0.5
+    if fit_intercept:
+        w = w[1:]
+    return pen + lambda_l1 * np.sum(np.abs(w)) + 0.5 * lambda_l2 * np.sum(w ** 2)
+
+
+@njit(
+    "float64(float64[:,:],float64[:],float64[:],float64[:],float64[:,:],float64[:],int64,float64,float64)",
+    error_model="numpy",
+)
+def _sample_objective(X_s, y_s, mu_s, scale, w, penalty, family_code, r, p_shrinkage):
+    """Update mu_s from w and returns the penalized deviance of the weighted sample."""
+    eta_s = X_s @ w[:, 0]
+    dev = 0.0
+    for k in range(len(y_s)):
+        mu_s[k] = np.exp(eta_s[k])
+        dev += scale[k] * _unit_deviance(y_s[k], mu_s[k], family_code, r, p_shrinkage)
+    return 0.5 * dev + 0.5 * np.sum(penalty * w[:, 0] ** 2)
+
+
+@njit(
+    "Tuple((float64[:,:],int64))(float64[:,:],float64[:,:],unicode_type,boolean,float64,float64,float64,float64[:,:],float64[:,:],int64,int64)",
+    error_model="numpy",
+)
+def sketched_irls(X, y, family, fit_intercept, lambda_l2, r, p_shrinkage, mu, w, sketch_size, max_iters):
+    """Irls on sketch_size rows sampled once, until the relative change is below SKETCH_SWITCH_TOL.
+
+    The rows are sampled with replacement with probabilities mixing W_i ||[1, x_i]||^2 at the starting mu and
+    the uniform distribution, which costs one pass over the data. Each sampled row is weighted by the inverse of its expected count,
+    so the sample deviance estimates the full deviance. The iterations then cost O(sketch_size p^2) and do not
+    touch the other rows. Returns the weights and the number of irls iterations.
+    """
+    n, p = X.shape
+    offset = fit_intercept * 1
+    q = p + offset
+    family_code = _family_code(family)
+
+    probs = np.full(n, fit_intercept * 1.0)
+    for j in range(p):
+        for i in range(n):
+            probs[i] += X[i, j] ** 2
+    for i in range(n):
+        W_i, z_i = _weight_and_response(y[i, 0], mu[i, 0], family_code, r, p_shrinkage)
+        probs[i] *= W_i
+    # half uniform, so that no sampled row weighs more than 2 n / sketch_size
+    probs = 0.5 * probs / np.sum(probs) + 0.5 / n
+    cdf = np.cumsum(probs)
+    idx = np.minimum(np.searchsorted(cdf, np.random.random(sketch_size), side="right"), n - 1)
+
+    m = sketch_size
+    X_s = np.empty((m, q))
+    y_s = np.empty(m)
+    mu_s = np.empty(m)
+    scale = np.empty(m)
+    for k in range(m):
+        i = idx[k]
+        if fit_intercept:
+            X_s[k, 0] = 1.0
+        for j in range(p):
+            X_s[k, j + offset] = X[i, j]
+        y_s[k] = y[i, 0]
+        mu_s[k] = mu[i, 0]
+        scale[k] = 1.0 / (m * probs[i])
+
+    penalty = np.full(q, lambda_l2)
+    penalty[:offset] = 0.0
+    X_w = np.empty((m, q))
+    z_w = np.empty((m, 1))
+    w_old = w.copy()
+    obj_old = np.inf
+    for niter in range(max_iters):
+        for k in range(m):
+            W_k, z_k = _weight_and_response(y_s[k], mu_s[k], family_code, r, p_shrinkage)
+            sqrt_w = (scale[k] * W_k) ** 0.5
+            X_w[k] = X_s[k] * sqrt_w
+            z_w[k, 0] = z_k * sqrt_w
+        gram = X_w.T @ X_w + np.diag(penalty)
+        w = np.linalg.solve(gram, X_w.T @ z_w)
+
+        obj = _sample_objective(X_s, y_s, mu_s, scale, w, penalty, family_code, r, p_shrinkage)
+        for _ in range(MAX_STEP_HALVING):
+            if obj <= obj_old:
+                break
+            w = (w + w_old) / 2
+            obj = _sample_objective(X_s, y_s, mu_s, scale, w, penalty, family_code, r, p_shrinkage)
+
+        if abs(obj - obj_old) / (abs(obj) + 0.1) < SKETCH_SWITCH_TOL:
+            break
+        obj_old = obj
+        w_old = w
+    return w, niter + 1
+
+
+@njit("float64[:,:](float64[:,:],float64[:,:],boolean,float64,int64[:])")
+def weighted_gram(X, W, fit_intercept, lambda_l2, active):
+    """Penalized weighted Gram matrix X'WX + lambda_l2 I restricted to the active coordinates.
+
+    The rows and columns of the coordinates out of the active set are zero.
+    """
+    n, p = X.shape
+    q = p + fit_intercept * 1
+    X_a = np.empty((n, len(active)))
+    for k in range(len(active)):
+        j = active[k]
+        if fit_intercept and j == 0:
+            X_a[:, k] = 1.0
+        else:
+            X_a[:, k] = X[:, j - fit_intercept * 1]
+    X_a *= W ** 0.5
+    gram_a = X_a.T @ X_a
+    gram = np.zeros((q, q))
+    for k in range(len(active)):
+        for l in range(len(active)):
+            gram[active[k], active[l]] = gram_a[k, l]
+        if active[k] >= fit_intercept * 1:
+            gram[active[k], active[k]] += lambda_l2
+    return gram
+
+
+@njit("float64[:,:](float64[:,:],float64[:,:])")
+def _cho_solve(L, b):
+    """Solve L L' x = b by forward and backward substitution, L lower triangular."""
+    q = L.shape[0]
+    x = b.copy()
+    for k in range(x.shape[1]):
+        for i in range(q):
+            acc = x[i, k]
+            for j in range(i):
+                acc -= L[i, j] * x[j, k]
+            x[i, k] = acc / L[i, i]
+        for i in range(q - 1, -1, -1):
+            acc = x[i, k]
+            for j in range(i + 1, q):
+                acc -= L[j, i] * x[j, k]
+            x[i, k] = acc / L[i, i]
+    return x
+
+
+@njit("float64[:,:](float64[:,:])")
+def _active_cholesky(gram):
+    """Lower Cholesky factor of gram restricted to the coordinates with a positive diagonal. The other rows
+    and columns are zero. The factor is nan when the restricted matrix is not positive definite.
+    """
+    q = gram.shape[0]
+    active = np.flatnonzero(np.diag(gram) > 0)
+    gram_a = np.empty((len(active), len(active)))
+    for k in range(len(active)):
+        for l in range(len(active)):
+            gram_a[k, l] = gram[active[k], active[l]]
+    factor = np.zeros((q, q))
+    try:
+        L = np.linalg.cholesky(gram_a)
+    except Exception:
+        factor[:, :] = np.nan
+        return factor
+    for k in range(len(active)):
+        for l in range(k + 1):
+            factor[active[k], active[l]] = L[k, l]
+    return factor
+
+
+@njit(
+    "Tuple((float64[:,:],int64,int64,float64,optional(float64[:,:])))(float64[:,:],float64[:,:],unicode_type,boolean,float64,float64,optional(float64[:,:]),float64,int64, float64, float64,unicode_type,int64,int64,boolean,optional(float64[:,:]),float64,optional(int64[:]))"
 )
 def fit_irls(
     X,
@@ -55,66 +311,181 @@ def fit_irls(
     tol=1e-3,
     p_shrinkage=1e-25,
     solver="inv",
+    sketch_size=1000,
+    seed=0,
+    compute_hessian=False,
+    w_init=None,
+    lambda_group=0.0,
+    groups=None,
 ):
     """
-    Fit the negative binomial regression
+    Fit the glm with an inexact Newton irls.
+
+    The inner ccd tolerance starts at INNER_TOL_MAX and is tightened with the relative
+    change of the penalized deviance, down to tol. The irls stops when the relative change
+    of the penalized deviance is below tol and the last inner problem was solved at tol.
+    A step increasing the penalized deviance is halved.
+
+    With solver="sketch" the irls first runs on sketch_size rows sampled once (see sketched_irls), then
+    finishes with exact "inv" steps on all the rows. The number of irls iterations counts both.
+
+    When w_init is given (the intercept first when fit_intercept is True), the irls starts from it
+    instead of w = 0 and the heuristic mu = (y + mean(y)) / 2, and the ccd starts on its active set.
 
+    With solver="bcd" the weighted least squares are solved by block coordinate descent on the feature groups
+    (negative labels for the features out of any group) with the group penalty lambda_group sum_g sqrt(p_g) ||w_g||_2.
+
+    Returns the weights, the number of irls iterations, the total number of ccd sweeps, the
+    deviance and, when compute_hessian is True, the lower Cholesky factor of the penalized weighted Gram
+    matrix X'WX + lambda_l2 I. The "inv" solver returns the factor it solved the last irls iteration with,
+    so W is taken at the previous iterate, which is within tol of the solution. The "ccd", "ccd_gram" and
+    "bcd" solvers build and factorize the matrix once with W at the solution, on its active set; the other
+    rows and columns of the factor are zero.
     """
     n, p = X.shape
-    w = np.ascontiguousarray(np.zeros((p + fit_intercept * 1, 1)))
-    w_old = np.ascontiguousarray(np.zeros((p + fit_intercept * 1, 1)))
-    mu = (y + np.mean(y)) / 2
+    if groups is None:
+        feature_groups = np.full(p, -1, dtype=np.int64)
+    else:
+        feature_groups = groups
+    if w_init is None:
+        w = np.ascontiguousarray(np.zeros((p + fit_intercept * 1, 1)))
+        mu = (y + np.mean(y)) / 2
+    else:
+        w = np.ascontiguousarray(w_init.copy())
+        mu = _inverse_link(X, w, fit_intercept)
+    w_old = w.copy()
     if lambda_l2 > 0.0:
         I = np.eye(p + fit_intercept * 1)
         if fit_intercept:
             I[0, 0] = 0
 
+    if family == "gaussian":
+        inner_tol = tol
+    else:
+        inner_tol = max(tol, INNER_TOL_MAX)
+    obj_old = np.inf
+    if w_init is not None and family != "gaussian":
+        obj_old = 0.5 * deviance(y, mu, family, r, p_shrinkage) + _penalty(
+            w, fit_intercept, lambda_l1, lambda_l2, lambda_group, feature_groups
+        )
+    ccd_niter = 0
+    factor = np.zeros((0, 0))
+
+    sketch_niter = 0
+    if (solver == "sketch") and (family != "gaussian") and (sketch_size < n):
+        np.random.seed(seed)
+        w, sketch_niter = sketched_irls(
+            X, y, family, fit_intercept, lambda_l2, r, p_shrinkage, mu, w, sketch_size, max_iters
+        )
+        mu = _inverse_link(X, w, fit_intercept)
+        obj_old = 0.5 * deviance(y, mu, family, r, p_shrinkage) + _penalty(
+            w, fit_intercept, lambda_l1, lambda_l2, lambda_group, feature_groups
+        )
+        w_old = w
+
     for irls_niter in range(max_iters):
 
         Wz = get_W_and_z(X, y, family=family, r=r, p_shrinkage=p_shrinkage, mu=mu)
         W = np.expand_dims(Wz[:, 0], 1)
         z = np.expand_dims(Wz[:, 1], 1)
 
-        if solver == "inv":
-            if fit_intercept:
-                X_tilde = add_constant(X) * W ** 0.5
-            else:
-                X_tilde = X * W ** 0.5
+        if solver == "inv" or solver == "sketch":
+            X_tilde = _to_fortran(X, W[:, 0] ** 0.5, fit_intercept)
             z_tilde = z * W ** 0.5
             if lambda_l2 > 0.0:
-                w = (
-                    np.linalg.inv(X_tilde.T @ X_tilde + lambda_l2 * I)
-                    @ X_tilde.T
-                    @ z_tilde
-                )
+                gram = X_tilde.T @ X_tilde + lambda_l2 * I
             else:
-                w = np.linalg.inv(X_tilde.T @ X_tilde) @ X_tilde.T @ z_tilde
-            ccd_niter = 0
+                gram = X_tilde.T @ X_tilde
+            factor = np.linalg.cholesky(gram)
+            w = _cho_solve(factor, X_tilde.T @ z_tilde)
+            inner_tol = tol
         elif solver == "ccd":
-            w, ccd_niter = ccd_pwls(
+            w, niter = ccd_pwls(
+                X,
+                z,
+                W,
+                b=w,
+                fit_intercept=fit_intercept,
+                lambda_l1=lambda_l1,
+                lambda_l2=lambda_l2,
+                Gamma=None,
+                bounds=bounds,
+                max_iters=max_iters,
+                tol=inner_tol,
+            )
+            ccd_niter += niter + 1
+        elif solver == "ccd_gram":
+            w, niter = ccd_gram_pwls(
                 X,
                 z,
                 W,
-                b=None,
+                b=w,
                 fit_intercept=fit_intercept,
                 lambda_l1=lambda_l1,
                 lambda_l2=lambda_l2,
                 Gamma=None,
                 bounds=bounds,
                 max_iters=max_iters,
-                tol=tol,
+                tol=inner_tol,
             )
+            ccd_niter += niter + 1
+        elif solver == "bcd":
+            w, niter = bcd_pwls(
+                X,
+                z,
+                W,
+                b=w,
+                fit_intercept=fit_intercept,
+                lambda_l1=lambda_l1,
+                lambda_l2=lambda_l2,
+                lambda_group=lambda_group,
+                groups=feature_groups,
+                max_iters=max_iters,
+                tol=inner_tol,
+            )
+            ccd_niter += niter + 1
 
         if family == "gaussian":  # no need to iterate irls for gaussian family
-            return w, 1, ccd_niter
+            if fit_intercept:
+                dev = deviance(y, X @ w[1:] + w[0], family, r, p_shrinkage)
+            else:
+                dev = deviance(y, X @ w, family, r, p_shrinkage)
+            break
 
-        if fit_intercept:
-            mu = np.exp(X @ w[1:] + w[0])
-        else:
-            mu = np.exp(X @ w)
+        mu = _inverse_link(X, w, fit_intercept)
+        dev = deviance(y, mu, family, r, p_shrinkage)
+        obj = 0.5 * dev + _penalty(w, fit_intercept, lambda_l1, lambda_l2, lambda_group, feature_groups)
+
+        # obj_old is infinite when the first step starts from the heuristic mu
+        if obj_old < np.inf:
+            for _ in range(MAX_STEP_HALVING):
+                if obj <= obj_old:
+                    break
+                w = (w + w_old) / 2
+                mu = _inverse_link(X, w, fit_intercept)
+                dev = deviance(y, mu, family, r, p_shrinkage)
+                obj = 0.5 * dev + _penalty(w, fit_intercept, lambda_l1, lambda_l2, lambda_group, feature_groups)
 
-        if np.linalg.norm(w_old - w) < tol:
+        rel_change = abs(obj - obj_old) / (abs(obj) + 0.1)
+        if rel_change < tol and inner_tol <= tol:
             break
+        inner_tol = max(tol, min(inner_tol, rel_change))
+        obj_old = obj
         w_old = w
 
-    return w, irls_niter, ccd_niter
+    hessian = None
+    if compute_hessian:
+        if solver == "ccd" or solver == "ccd_gram" or solver == "bcd":
+            if lambda_l1 > 0.0 or lambda_group > 0.0:
+                active = np.flatnonzero(w[:, 0] != 0.0)
+                if fit_intercept and (len(active) == 0 or active[0] != 0):
+                    active = np.concatenate((np.zeros(1, np.int64), active))
+            else:
+                active = np.arange(p + fit_intercept * 1)
+            if family != "gaussian":  # weights of the final coefficients, one more pass over the rows
+                W = np.expand_dims(get_W_and_z(X, y, family, r, p_shrinkage, mu)[:, 0], 1)
+            hessian = _active_cholesky(weighted_gram(X, W, fit_intercept, lambda_l2, active))
+        else:
+            hessian = factor
+
+    return w, sketch_niter + irls_niter + 1, ccd_niter, dev, hessian
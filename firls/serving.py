@@ -0,0 +1,263 @@
+"""Micro-batching scoring service for fitted glm.
+
+Concurrent scoring requests are queued and scored together, within a max latency and max
+batch size window, with a single vectorized call to the model predict. The model can be
+swapped while the service is running: the pending requests are scored by the new model and
+none of them is dropped.
+
+The service can be exposed as a minimal local HTTP/1.1 server, on a TCP port or a Unix
+socket, to load test it on one machine:
+
+    POST /predict  {"x": [...]}   ->  {"prediction": float, "version": int}
+    GET  /stats                   ->  latency percentiles and throughput
+
+From the command line with a pickled model: python -m firls.serving model.pkl --port 8000
+"""
+
+import argparse
+import asyncio
+import json
+import pickle
+import time
+from collections import deque
+
+import numpy as np
+
+
+_HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed"}
+
+
+class ScoringService:
+    """Asyncio scoring service collecting concurrent requests into micro-batches.
+
+    Parameters
+    ----------
+    model : FastGlm
+        A fitted model. Any object with a vectorized predict(X) method can be used.
+
+    max_batch_size : int
+        Maximum number of rows scored in a single predict call.
+
+    max_latency : float
+        Maximum time in seconds the first request of a batch waits for other requests.
+
+    stats_window : int
+        Number of most recent request latencies kept to compute the percentiles.
+
+    """
+
+    def __init__(self, model, max_batch_size=256, max_latency=0.002, stats_window=100000):
+        self._model = model
+        self.version = 0
+        self.max_batch_size = int(max_batch_size)
+        self.max_latency = float(max_latency)
+        self._pending = deque()
+        self._has_items = None
+        self._worker = None
+        self._latencies = deque(maxlen=int(stats_window))
+        self.reset_stats()
+
+    @property
+    def model(self):
+        return self._model
+
+    def swap_model(self, model):
+        """Replace the model without dropping the pending requests. Returns the new version.
+
+        The pending requests were validated against the current model, so a model with another number
+        of features is rejected.
+        """
+        coef, coef_new = getattr(self._model, "coef_", None), getattr(model, "coef_", None)
+        if coef is not None and coef_new is not None and np.size(coef) != np.size(coef_new):
+            raise ValueError(
+                "Expected a model with {} features, got {}.".format(np.size(coef), np.size(coef_new))
+            )
+        self._model = model
+        self.version += 1
+        return self.version
+
+    def reset_stats(self):
+        self._latencies.clear()
+        self._n_requests = 0
+        self._n_batches = 0
+        self._start_time = time.perf_counter()
+
+    def stats(self):
+        """Returns the number of requests and batches, the p50/p99 latencies in seconds and
+        the throughput in requests per second since the last reset."""
+        elapsed = time.perf_counter() - self._start_time
+        latencies = np.array(self._latencies)
+        return {
+            "version": self.version,
+            "n_requests": self._n_requests,
+            "n_batches": self._n_batches,
+            "mean_batch_size": self._n_requests / max(self._n_batches, 1),
+            "p50_latency": float(np.percentile(latencies, 50)) if len(latencies) else None,
+            "p99_latency": float(np.percentile(latencies, 99)) if len(latencies) else None,
+            "throughput": self._n_requests / elapsed if elapsed > 0 else 0.0,
+        }
+
+    async def start(self):
+        """Start the batching worker in the running event loop."""
+        if self._worker is None:
+            self._has_items = asyncio.Event()
+            self._worker = asyncio.get_event_loop().create_task(self._batch_loop())
+            self.reset_stats()
+
+    async def stop(self):
+        """Score the pending requests and stop the batching worker."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        while self._pending:
+            self._score_batch(self._pop_batch())
+
+    async def submit(self, x):
+        """Queue one row for scoring. Returns the prediction and the model version used."""
+        if self._worker is None:
+            raise RuntimeError("The service is not started.")
+        x = np.asarray(x, dtype=np.float64).ravel()
+        coef = getattr(self._model, "coef_", None)
+        if coef is not None and x.shape[0] != np.size(coef):
+            raise ValueError(
+                "Expected {} features, got {}.".format(np.size(coef), x.shape[0])
+            )
+        future = asyncio.get_event_loop().create_future()
+        self._pending.append((x, future, time.perf_counter()))
+        self._has_items.set()
+        return await future
+
+    async def score(self, x):
+        """Score one row. Returns the prediction."""
+        prediction, version = await self.submit(x)
+        return prediction
+
+    async def _batch_loop(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            if not self._pending:
+                self._has_items.clear()
+                await self._has_items.wait()
+            deadline = loop.time() + self.max_latency
+            while len(self._pending) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                self._has_items.clear()
+                try:
+                    await asyncio.wait_for(self._has_items.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            self._score_batch(self._pop_batch())
+
+    def _pop_batch(self):
+        n = min(len(self._pending), self.max_batch_size)
+        return [self._pending.popleft() for _ in range(n)]
+
+    def _score_batch(self, batch):
+        model, version = self._model, self.version
+        try:
+            predictions = np.ravel(model.predict(np.vstack([x for x, _, _ in batch])))
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        now = time.perf_counter()
+        for (_, future, start), prediction in zip(batch, predictions):
+            if not future.done():
+                future.set_result((float(prediction), version))
+            self._latencies.append(now - start)
+        self._n_requests += len(batch)
+        self._n_batches += 1
+
+    async def _route(self, method, path, body):
+        if path == "/predict":
+            if method != "POST":
+                return 405, {"error": "use POST"}
+            try:
+                x = json.loads(body.decode("utf-8"))["x"]
+                prediction, version = await self.submit(x)
+            except (ValueError, KeyError, TypeError) as e:
+                return 400, {"error": str(e)}
+            return 200, {"prediction": prediction, "version": version}
+        elif path == "/stats":
+            return 200, self.stats()
+        return 404, {"error": "unknown path " + path}
+
+    async def _handle_http(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path = request_line.decode("latin-1").split(" ")[:2]
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    key, value = line.decode("latin-1").split(":", 1)
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                status, payload = await self._route(method, path, body)
+                data = json.dumps(payload).encode("utf-8")
+                writer.write(
+                    "HTTP/1.1 {} {}\r\nContent-Type: application/json\r\n"
+                    "Content-Length: {}\r\n\r\n".format(
+                        status, _HTTP_REASONS[status], len(data)
+                    ).encode("latin-1")
+                    + data
+                )
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start_server(self, host="127.0.0.1", port=8000, path=None):
+        """Start the service and a local HTTP server, on a Unix socket when path is given.
+
+        Returns the asyncio server.
+        """
+        await self.start()
+        if path is not None:
+            return await asyncio.start_unix_server(self._handle_http, path=path)
+        return await asyncio.start_server(self._handle_http, host, port)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a pickled fitted glm.")
+    parser.add_argument("model", help="path of the pickled model")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--unix-socket", default=None)
+    parser.add_argument("--max-batch-size", type=int, default=256)
+    parser.add_argument("--max-latency", type=float, default=0.002)
+    args = parser.parse_args(argv)
+
+    with open(args.model, "rb") as f:
+        model = pickle.load(f)
+    service = ScoringService(
+        model, max_batch_size=args.max_batch_size, max_latency=args.max_latency
+    )
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(
+        service.start_server(args.host, args.port, path=args.unix_socket)
+    )
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
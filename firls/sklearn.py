@@ -1,24 +1,42 @@
+from contextlib import contextmanager
+
 import numpy as np
-from scipy import optimize
+from numba import get_num_threads, set_num_threads
+from scipy import linalg, optimize, stats
 from sklearn.linear_model.base import LinearClassifierMixin, BaseEstimator
+from sklearn.utils import check_random_state
 from sklearn.utils.validation import check_X_y, check_array
 
-from firls.irls import fit_irls
+from firls.cost_model import default_sketch_size, load_calibration, select_solver
+from firls.irls import VALID_FAMILY, fit_irls
 from firls.loss_and_grad import _glm_loss_and_grad
 from firls.loss_and_grad import inverse_logit
 
-VALID_FAMILLY = ["gaussian", "binomial", "bernouilli", "poisson", "negativebinomial"]
-VALID_SOLVER = ["ccd", "inv"]
+try:
+    from threadpoolctl import threadpool_limits
+except ImportError:  # the BLAS threads are then left to their default
+    threadpool_limits = None
+
+VALID_SOLVER = ["ccd", "ccd_gram", "inv", "sketch", "bcd", "auto"]
+CCD_SOLVER = ["ccd", "ccd_gram", "bcd", "auto"]
 
 
-def _check_solver(solver, bounds, lambda_l1):
+def _check_solver(solver, bounds, lambda_l1, groups=None, lambda_group=None):
     """Helper function for selecting the solver.
     """
+    if lambda_group is not None and lambda_group > 0 and groups is None:
+        raise ValueError("'lambda_group' requires 'groups'")
+    if groups is not None:
+        if solver not in (None, "auto", "bcd"):
+            raise ValueError("Only the bcd solver is allowed with 'groups'")
+        if bounds is not None:
+            raise ValueError("'bounds' are not supported with 'groups'")
+        return "bcd"
     if solver is not None:
         if solver not in VALID_SOLVER:
             raise ValueError("'solver' must be in " + repr(VALID_SOLVER))
-        if lambda_l1 is not None and solver != "ccd":
-            raise ValueError("Only ccd solver is allowed with 'lambda_l1'")
+        if lambda_l1 is not None and solver not in CCD_SOLVER:
+            raise ValueError("Only ccd solvers are allowed with 'lambda_l1'")
 
         return solver
     elif bounds is not None:
@@ -29,6 +47,40 @@ def _check_solver(solver, bounds, lambda_l1):
         return "inv"
 
 
+@contextmanager
+def _limit_threads(n_threads):
+    """Set the number of numba threads, and of the BLAS threads when threadpoolctl is installed."""
+    if n_threads is None:
+        yield
+        return
+    n_threads_default = get_num_threads()
+    set_num_threads(int(n_threads))
+    blas_limits = None
+    if threadpool_limits is not None:
+        blas_limits = threadpool_limits(limits=int(n_threads), user_api="blas")
+    try:
+        yield
+    finally:
+        set_num_threads(n_threads_default)
+        if blas_limits is not None:
+            blas_limits.restore_original_limits()
+
+
+def _cov_params(factor, dispersion):
+    """Covariance of the estimates from the lower Cholesky factor of the final irls system.
+
+    The coordinates out of the active set (zero rows of the factor) get a nan covariance, as every
+    coordinate when the system is not positive definite (nan factor).
+    """
+    cov = np.full(factor.shape, np.nan)
+    active = np.flatnonzero(np.diag(factor) > 0)
+    factor_a = factor[np.ix_(active, active)]
+    cov[np.ix_(active, active)] = dispersion * linalg.cho_solve(
+        (factor_a, True), np.eye(len(active))
+    )
+    return cov
+
+
 def _predict_glm(X, coef, family, intercept):
     if family == "gaussian":
         return X @ coef + intercept
@@ -69,7 +121,7 @@ class FastGlm(BaseEstimator, LinearClassifierMixin):
         Returns the predicted values.
 
         """
-        if self.family == "binomial":
+        if self.family in ("binomial", "bernoulli"):
             return self.predict_proba(X)
         return _predict_glm(X, self.coef_, self.family, self.intercept_)
 
@@ -89,7 +141,7 @@ class FastGlm(BaseEstimator, LinearClassifierMixin):
         """
         if self.family == "gaussian":
             raise NotImplemented()
-        elif self.family == "binomial":
+        elif self.family in ("binomial", "bernoulli"):
             return inverse_logit((X @ self.coef_) + self.intercept_)
         elif self.family == "poisson":
             return self
@@ -104,6 +156,7 @@ class GLM(FastGlm):
         ||y - Xw - c||^2_2
         + lambda_l1  ||w||_1
         + 0.5 * lambda_l2 ||w||^2_2
+        + lambda_group sum_g sqrt(p_g) ||w_g||_2
 
         u.c. l_i <= w_i <= u_i, i = 1:p
 
@@ -136,6 +189,16 @@ class GLM(FastGlm):
         Solver to be used in the iterative reweighed least squared procedure.
         - "inv" : use the matrix inverse. This only works with lambda_l1=0.
         - "ccd" : use the cyclical coordinate descent.
+        - "ccd_gram" : use the cyclical coordinate descent with covariance updates. The weighted Gram
+          matrix is built once per irls iteration, then each sweep costs O(p^2). Faster when n >> p.
+        - "sketch" : run the irls on sketch_size rows sampled once with importance weights, then
+          finish with a few exact "inv" steps on all the rows. This is meant for very tall problems
+          and only works with lambda_l1=0.
+        - "bcd" : use the block coordinate descent on the feature groups, see groups. Each group is
+          minimized at once from its weighted Gram block, factorized once per irls iteration.
+        - "auto" : select the solver with the lowest estimated fit time given n, p, the dtype, the penalties
+          and the cores, see firls.cost_model. The estimate uses the machine rates stored by
+          firls.cost_model.calibrate() when available.
         When lambda_l1>0 "ccd" is automatically selected. For problem with low dimension (p<1000) the "inv"
         method should be faster.
 
@@ -143,11 +206,79 @@ class GLM(FastGlm):
         Number of maximum iteration for the iterative reweighed least squared procedure.
 
     tol : float
-        Convergence tolerance for the ccd algorithm. the algorithm stops when ||w - w_old ||_2 < tol.
+        Convergence tolerance. The irls stops when the relative change of the penalized deviance is
+        below tol. The inner ccd tolerance on ||w - w_old ||_2 is tightened along the irls iterations
+        down to tol.
 
     p_shrinkage : float
         Shrink the probabilities for better stability.
 
+    sketch_size : int, optional
+        Number of rows sampled by the "sketch" solver, at least the number of coefficients.
+        Default to max(1000, 20 * p, n // 50).
+
+    random_state : int, RandomState instance or None, optional
+        Seed of the row sampling of the "sketch" solver.
+
+    warm_start : bool
+        When True, reuse the solution of the previous call to fit as initialization. The irls then starts
+        from its linear predictor instead of the heuristic mu and the ccd from its active set. A fit on a
+        different number of features starts cold.
+
+    n_threads : int, optional
+        Number of threads of the parallel kernels (weights, linear predictor, deviance and design copies)
+        and, when threadpoolctl is installed, of the BLAS. Default to all the numba threads.
+
+    lambda_group : float, optional
+        The group penalty parameter "Group lasso", weighted by the square root of the group size p_g.
+        With lambda_l1 it gives the sparse group lasso.
+
+    groups : array, optional
+        Integer group label of each feature, the features out of any group have a negative label. When
+        given the "bcd" solver is used. Grouping correlated features (spline bases, one-hot blocks) also
+        speeds up the fit with lambda_group=0.
+
+    compute_cov : bool
+        Whether to compute the covariance of the estimates from the final irls system X'WX + lambda_l2 I.
+        With lambda_l1>0 it is computed on the non zero coefficients only, the others get nan.
+
+    Attributes
+    ----------
+    solver_ : str
+        Solver used for the fit.
+
+    solver_reason_ : str
+        Why the solver was used, with the estimated fit times when solver="auto".
+
+    irls_niter_ : int
+        Number of irls iterations.
+
+    ccd_niter_ : int
+        Total number of ccd sweeps over all the irls iterations.
+
+    deviance_ : float
+        Deviance of the fitted model.
+
+    dispersion_ : float
+        Dispersion parameter. deviance_ / (n - k) for the gaussian family, 1 otherwise. k counts the
+        intercept and the non zero coefficients when lambda_l1>0 or lambda_group>0.
+
+    cov_params_ : array, shape (k, k)
+        Covariance of the estimates, only with compute_cov=True. The intercept comes first when
+        fit_intercept is True. For the negative binomial family the observed information is used.
+        The "inv" solver reuses the system of its last irls iteration, whose weights come from the
+        previous iterate, within tol of the solution. The other solvers recompute the weights at the
+        solution.
+
+    bse_ : array, shape (k,)
+        Standard errors of the estimates, ordered as cov_params_.
+
+    tvalues_ : array, shape (k,)
+        Wald statistics of the estimates, ordered as cov_params_.
+
+    pvalues_ : array, shape (k,)
+        Two-sided p-values of the Wald statistics under the normal distribution.
+
     """
 
     def __init__(
@@ -162,47 +293,163 @@ class GLM(FastGlm):
         max_iters=10000,
         tol=1e-8,
         p_shrinkage=1e-25,
+        sketch_size=None,
+        random_state=None,
+        compute_cov=False,
+        warm_start=False,
+        n_threads=None,
+        lambda_group=None,
+        groups=None,
     ):
 
-        self.solver = _check_solver(solver, bounds, lambda_l1)
+        self.solver = _check_solver(solver, bounds, lambda_l1, groups, lambda_group)
         self.lambda_l1 = float(lambda_l1) if lambda_l1 is not None else 0.0
         self.lambda_l2 = float(lambda_l2) if lambda_l2 is not None else 0.0
         self.r = float(r)
 
-        if family not in VALID_FAMILLY:
-            raise ValueError("'family' must be in " + repr(VALID_FAMILLY))
+        if family not in VALID_FAMILY:
+            raise ValueError("'family' must be in " + repr(VALID_FAMILY))
         self._family = str(family)
         self.bounds = bounds if bounds is None else check_array(bounds)
         self.fit_intercept = fit_intercept
         self.tol = float(tol)
         self.max_iters = int(max_iters)
         self.p_shrinkage = float(p_shrinkage)
+        self.sketch_size = sketch_size
+        self.random_state = random_state
+        self.compute_cov = compute_cov
+        self.warm_start = warm_start
+        self.n_threads = n_threads
+        self.lambda_group = float(lambda_group) if lambda_group is not None else 0.0
+        self.groups = groups if groups is None else np.asarray(groups, dtype=np.int64).ravel()
+
+    def _init_coef(self, n_features, coef_init, intercept_init):
+        """Initial weights of the irls, the intercept first. None for a cold start."""
+        if coef_init is None and self.warm_start and hasattr(self, "_coef"):
+            if len(self._coef) != n_features:  # new features, cold start
+                return None
+            coef_init, intercept_init = self._coef, self._intercept
+        if coef_init is None:
+            return None
+        coef_init = np.asarray(coef_init, dtype=np.float64).ravel()
+        if coef_init.shape[0] != n_features:
+            raise ValueError(
+                "'coef_init' has {} features, expected {}".format(coef_init.shape[0], n_features)
+            )
+        if self.fit_intercept:
+            intercept_init = 0.0 if intercept_init is None else float(np.ravel(intercept_init)[0])
+            coef_init = np.concatenate(([intercept_init], coef_init))
+        return coef_init.reshape((-1, 1))
+
+    def fit(self, X, y, coef_init=None, intercept_init=None):
+        """Fit the model.
 
-    def fit(self, X, y):
-        X, y = check_X_y(X, y, ensure_2d=True, accept_sparse=False)
-        X = np.ascontiguousarray(X)
+        Parameters
+        ----------
+        X : array
+            data
+
+        y : array
+            target
+
+        coef_init : array, optional
+            Initial coefficients. Overrides the solution of the previous fit when warm_start is True.
+
+        intercept_init : float, optional
+            Initial intercept.
+
+        Returns
+        -------
+        Returns self.
+
+        """
+        itemsize = np.asarray(X).dtype.itemsize
+        X, y = check_X_y(X, y, ensure_2d=True, accept_sparse=False, dtype=np.float64)
+        # converted once per fit: the kernels read the design column by column
+        X = np.asfortranarray(X)
         y = np.ascontiguousarray(y)
 
         if y.ndim != 2:
             y = y.reshape((len(y), 1))
 
-        coef_, irls_niter, ccd_niter = fit_irls(
-            X,
-            y,
-            family=self._family,
-            fit_intercept=self.fit_intercept,
-            lambda_l1=float(self.lambda_l1) if self.lambda_l1 is not None else 0.0,
-            lambda_l2=float(self.lambda_l2) if self.lambda_l2 is not None else 0.0,
-            bounds=self.bounds,
-            r=self.r,
-            max_iters=self.max_iters,
-            tol=self.tol,
-            p_shrinkage=self.p_shrinkage,
-            solver=self.solver,
-        )
+        if self.groups is not None and self.groups.shape[0] != X.shape[1]:
+            raise ValueError(
+                "'groups' has {} features, expected {}".format(self.groups.shape[0], X.shape[1])
+            )
+
+        if self.sketch_size is None:
+            sketch_size = default_sketch_size(*X.shape)
+        else:
+            sketch_size = int(self.sketch_size)
+        seed = check_random_state(self.random_state).randint(np.iinfo(np.int32).max)
+
+        if self.solver == "auto":
+            self.solver_, self.solver_reason_ = select_solver(
+                X.shape[0],
+                X.shape[1],
+                fit_intercept=self.fit_intercept,
+                lambda_l1=self.lambda_l1,
+                bounds=self.bounds,
+                family=self._family,
+                itemsize=itemsize,
+                sketch_size=sketch_size,
+                n_cores=self.n_threads,
+                calibration=load_calibration(),
+            )
+        else:
+            self.solver_ = self.solver
+            self.solver_reason_ = "solver={!r} at construction".format(self.solver)
+
+        # "auto" only considers the sketch solver with enough rows for a non singular Hessian
+        if self.solver_ == "sketch" and sketch_size < X.shape[1] + int(self.fit_intercept):
+            raise ValueError(
+                "'sketch_size' must be at least the number of coefficients {}, got {}".format(
+                    X.shape[1] + int(self.fit_intercept), sketch_size
+                )
+            )
+
+        w_init = self._init_coef(X.shape[1], coef_init, intercept_init)
+
+        with _limit_threads(self.n_threads):
+            coef_, irls_niter, ccd_niter, deviance, factor = fit_irls(
+                X,
+                y,
+                family=self._family,
+                fit_intercept=self.fit_intercept,
+                lambda_l1=float(self.lambda_l1) if self.lambda_l1 is not None else 0.0,
+                lambda_l2=float(self.lambda_l2) if self.lambda_l2 is not None else 0.0,
+                bounds=self.bounds,
+                r=self.r,
+                max_iters=self.max_iters,
+                tol=self.tol,
+                p_shrinkage=self.p_shrinkage,
+                solver=self.solver_,
+                sketch_size=sketch_size,
+                seed=seed,
+                compute_hessian=bool(self.compute_cov),
+                w_init=w_init,
+                lambda_group=self.lambda_group,
+                groups=self.groups,
+            )
         self.irls_niter_ = irls_niter
         self.ccd_niter_ = ccd_niter
         coef = coef_.ravel()
+
+        self.deviance_ = deviance
+        if self.lambda_l1 > 0.0 or self.lambda_group > 0.0:
+            # same active set as the covariance: the non zero coefficients and the intercept
+            n_active = np.count_nonzero(coef[int(self.fit_intercept) :]) + int(self.fit_intercept)
+        else:
+            n_active = len(coef)
+        if self._family == "gaussian":
+            self.dispersion_ = deviance / (X.shape[0] - n_active)
+        else:
+            self.dispersion_ = 1.0
+        if self.compute_cov:
+            self.cov_params_ = _cov_params(factor, self.dispersion_)
+            self.bse_ = np.sqrt(np.diag(self.cov_params_))
+            self.tvalues_ = coef / self.bse_
+            self.pvalues_ = 2 * stats.norm.sf(np.abs(self.tvalues_))
         if self.fit_intercept:
             self._coef = coef[1:]
             self._intercept = coef[0]
@@ -1,4 +1,4 @@
-from firls.ccd import ccd_pwls
+from firls.ccd import ccd_pwls, bcd_pwls
 from firls.tests.simulate import simulate_supervised_gaussian
 import numpy as np
 import pytest
@@ -22,3 +22,68 @@ def test_wlsq():
     )
     w_cf = np.linalg.inv(X.T @ X) @ X.T @ y
     np.testing.assert_almost_equal(w.ravel(), w_cf, 4)
+
+
+@pytest.mark.parametrize("fit_intercept", (False, True))
+def test_wlsq_layout(fit_intercept):
+    n = 1000
+    y, X, true_beta = simulate_supervised_gaussian(n, 40)
+    W = np.random.RandomState(0).uniform(0.5, 2, size=(n, 1))
+    w_c, niters = ccd_pwls(
+        np.ascontiguousarray(X), y.reshape(n, 1), W, None, fit_intercept, 0.0, 0.0, None, None, 10000, 1e-10
+    )
+    w_f, niters = ccd_pwls(
+        np.asfortranarray(X), y.reshape(n, 1), W, None, fit_intercept, 0.0, 0.0, None, None, 10000, 1e-10
+    )
+    X_tilde = np.column_stack((np.ones(n), X)) if fit_intercept else X
+    w_cf = np.linalg.solve(X_tilde.T @ (W * X_tilde), X_tilde.T @ (W.ravel() * y))
+    np.testing.assert_almost_equal(w_c.ravel(), w_cf, 6)
+    np.testing.assert_almost_equal(w_f.ravel(), w_cf, 6)
+
+
+@pytest.mark.parametrize("lambda_l1", (0.0, 20.0))
+def test_bcd_kkt(lambda_l1):
+    rng = np.random.RandomState(0)
+    n = 500
+    base = rng.normal(size=(n, 1))
+    X = np.column_stack(
+        [base + 0.2 * rng.normal(size=(n, 3)), rng.normal(size=(n, 3)), rng.normal(size=(n, 2))]
+    )
+    groups = np.array([0, 0, 0, 1, 1, 1, -1, -1], dtype=np.int64)
+    y = X[:, :3] @ np.array([1.0, 0.5, 0.0]) + X[:, 6] + rng.normal(size=n) + 2
+    W = rng.uniform(0.5, 2, size=(n, 1))
+    lambda_l2, lambda_group = 1.0, 100.0
+    w, niters = bcd_pwls(
+        X, y.reshape(n, 1), W, None, True, lambda_l1, lambda_l2, lambda_group, groups, 10000, 1e-12
+    )
+    w = w.ravel()
+    X_tilde = np.column_stack((np.ones(n), X))
+    grad = -X_tilde.T @ (W.ravel() * (y - X_tilde @ w))
+    grad[1:] += lambda_l2 * w[1:]
+
+    np.testing.assert_allclose(grad[0], 0, atol=1e-6)
+    assert np.all(w[4:7] == 0)
+    g_zero = np.sign(grad[4:7]) * np.maximum(np.abs(grad[4:7]) - lambda_l1, 0)
+    assert np.sum(g_zero ** 2) ** 0.5 <= lambda_group * 3 ** 0.5
+    w_g = w[1:4]
+    nonzero = w_g != 0
+    assert nonzero.any()
+    grad_g = grad[1:4] + lambda_group * 3 ** 0.5 * w_g / np.sum(w_g ** 2) ** 0.5
+    np.testing.assert_allclose(grad_g[nonzero] + lambda_l1 * np.sign(w_g[nonzero]), 0, atol=1e-4)
+    assert np.all(np.abs(grad_g[~nonzero]) <= lambda_l1 + 1e-6)
+    singles = grad[7:] + lambda_l1 * np.sign(w[7:])
+    np.testing.assert_allclose(singles[w[7:] != 0], 0, atol=1e-6)
+
+
+def test_bcd_collinear_block():
+    rng = np.random.RandomState(0)
+    n = 500
+    x = rng.normal(size=(n, 1))
+    X = np.column_stack([x, x, rng.normal(size=(n, 2))])
+    groups = np.array([0, 0, 1, 1], dtype=np.int64)
+    y = 2 * x[:, 0] + X[:, 2] + rng.normal(size=n)
+    w, niters = bcd_pwls(X, y.reshape(n, 1), None, None, True, 0.0, 0.0, 0.0, groups, 10000, 1e-10)
+    w = w.ravel()
+    # the minimum norm solution splits the effect between the identical columns
+    X_tilde = np.column_stack((np.ones(n), X))
+    np.testing.assert_almost_equal(w, np.linalg.pinv(X_tilde) @ y, 6)
@@ -0,0 +1,50 @@
+import numpy as np
+
+from firls.cost_model import calibrate, estimate_costs, load_calibration, select_solver
+from firls.sklearn import GLM
+from firls.tests.simulate import simulate_supervised_poisson
+
+
+def test_select_solver():
+    calibration = {"blas_flops": 1e10, "stream_flops": 1e9, "n_cores": 1}
+    solver, reason = select_solver(1000, 10, lambda_l1=1.0, calibration=calibration)
+    assert solver in ("ccd", "ccd_gram")
+    solver, reason = select_solver(10000, 10, bounds=np.ones((10, 2)), calibration=calibration)
+    assert solver in ("ccd", "ccd_gram")
+    # many rows and few columns: one Gram matrix pass beats the ccd sweeps over the data
+    solver, reason = select_solver(10 ** 6, 20, calibration=calibration)
+    assert solver in ("inv", "ccd_gram", "sketch")
+    # very wide: the O(p^3) inverse is ruled out
+    solver, reason = select_solver(500, 20000, calibration=calibration)
+    assert solver == "ccd"
+    assert "calibrated" in reason
+
+
+def test_select_solver_n_cores():
+    # the calibrated BLAS rate is scaled down to the threads of the fit
+    calibration = {"blas_flops": 16e10, "stream_flops": 1e9, "n_cores": 16}
+    solver, reason = select_solver(10000, 300, family="gaussian", n_cores=16, calibration=calibration)
+    assert solver == "inv"
+    solver, reason = select_solver(10000, 300, family="gaussian", n_cores=1, calibration=calibration)
+    assert solver == "ccd"
+    # more threads than calibrated do not make the BLAS faster
+    costs_16 = estimate_costs(10000, 300, n_cores=16, calibration=calibration)
+    costs_64 = estimate_costs(10000, 300, n_cores=64, calibration=calibration)
+    assert costs_16 == costs_64
+
+
+def test_calibration(tmpdir):
+    path = str(tmpdir.join("firls", "calibration.json"))
+    assert load_calibration(path) is None
+    calibration = calibrate(path, n=2000, p=20, repeat=1)
+    assert load_calibration(path) == calibration
+    assert calibration["blas_flops"] > 0 and calibration["stream_flops"] > 0
+
+
+def test_glm_auto():
+    y, X, true_beta = simulate_supervised_poisson(1000, 5)
+    glm = GLM(family="poisson", solver="auto", lambda_l1=1.0).fit(X, y)
+    assert glm.solver_ in ("ccd", "ccd_gram")
+    assert glm.solver_reason_.startswith("n=1000, p=5")
+    glm_ccd = GLM(family="poisson", solver="ccd", lambda_l1=1.0).fit(X, y)
+    np.testing.assert_almost_equal(glm.coef_, glm_ccd.coef_, 6)
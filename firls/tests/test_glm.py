@@ -58,7 +58,7 @@ def test_sglm(family):
 @pytest.mark.parametrize(
     "family", ("gaussian", "poisson", "negativebinomial", "binomial")
 )
-@pytest.mark.parametrize("solver", ("inv", "ccd"))
+@pytest.mark.parametrize("solver", ("inv", "ccd", "ccd_gram", "auto"))
 def test_glm(family, solver):
     np.random.seed(123)
 
@@ -103,3 +103,157 @@ def test_glm(family, solver):
     np.testing.assert_almost_equal(
         sm_coefs[0], sglm.intercept_, 4, err_msg="familly error: {}".format(family)
     )
+
+
+@pytest.mark.parametrize("family", ("poisson", "negativebinomial", "binomial"))
+def test_glm_sketch(family):
+    if family == "poisson":
+        y, X, true_beta = simulate_supervised_poisson(20000, 10)
+    elif family == "negativebinomial":
+        y, X, true_beta = simulate_supervised_negative_binomial(20000, 10, r=1)
+    elif family == "binomial":
+        y, X, true_beta = simulate_supervised_binomial(20000, 10, r=1)
+
+    glm_inv = GLM(family=family, fit_intercept=True, solver="inv").fit(X, y)
+    glm_sketch = GLM(
+        family=family, fit_intercept=True, solver="sketch", sketch_size=500, random_state=0
+    ).fit(X, y)
+
+    np.testing.assert_almost_equal(glm_inv.coef_, glm_sketch.coef_, 6)
+    np.testing.assert_almost_equal(glm_inv.intercept_, glm_sketch.intercept_, 6)
+
+    # the sketched Hessian is singular with fewer rows than coefficients
+    with pytest.raises(ValueError):
+        GLM(family=family, solver="sketch", sketch_size=10).fit(X, y)
+    # the other solvers do not use sketch_size
+    GLM(family=family, solver="inv", sketch_size=10).fit(X, y)
+    assert GLM(family=family, solver="auto", sketch_size=10).fit(X, y).solver_ != "sketch"
+
+
+@pytest.mark.parametrize("family", ("gaussian", "poisson", "binomial"))
+@pytest.mark.parametrize("solver", ("inv", "ccd"))
+def test_glm_cov(family, solver):
+    if family == "gaussian":
+        y, X, true_beta = simulate_supervised_gaussian(100, 4)
+        sm_family = sm.families.Gaussian()
+    elif family == "poisson":
+        y, X, true_beta = simulate_supervised_poisson(100, 4)
+        sm_family = sm.families.Poisson()
+    elif family == "binomial":
+        y, X, true_beta = simulate_supervised_binomial(100, 4, r=1)
+        sm_family = sm.families.Binomial()
+
+    sglm = GLM(family=family, fit_intercept=True, solver=solver, compute_cov=True)
+    sglm.fit(X, y)
+    fit = sm.GLM(y, sm.add_constant(X), family=sm_family).fit()
+
+    np.testing.assert_almost_equal(fit.deviance, sglm.deviance_, 4)
+    np.testing.assert_almost_equal(fit.scale, sglm.dispersion_, 4)
+    np.testing.assert_almost_equal(fit.cov_params(), sglm.cov_params_, 4)
+    np.testing.assert_almost_equal(fit.bse, sglm.bse_, 4)
+    np.testing.assert_almost_equal(fit.pvalues, sglm.pvalues_, 4)
+
+
+def test_glm_cov_lasso():
+    y, X, true_beta = simulate_supervised_poisson(100, 4)
+    sglm = GLM(family="poisson", lambda_l1=200, compute_cov=True).fit(X, y)
+    zero = np.concatenate(([False], sglm.coef_ == 0))
+    assert zero.any() and not zero.all()
+    assert np.isnan(sglm.bse_[zero]).all()
+    assert np.isfinite(sglm.bse_[~zero]).all()
+
+
+@pytest.mark.parametrize("family", ("gaussian", "poisson", "binomial"))
+def test_glm_groups(family):
+    rng = np.random.RandomState(0)
+    n = 1000
+    base = rng.normal(size=(n, 1))
+    X = np.column_stack([base + 0.05 * rng.normal(size=(n, 3)), rng.normal(size=(n, 3))])
+    groups = np.array([0, 0, 0, 1, 1, 1])
+    eta = 0.8 * X[:, 0] - 0.4 * X[:, 1]
+    if family == "gaussian":
+        y = eta + rng.normal(size=n)
+    elif family == "poisson":
+        y = rng.poisson(np.exp(eta)) * 1.0
+    else:
+        y = (rng.uniform(size=n) < 1 / (1 + np.exp(-eta))) * 1.0
+
+    # without the group penalty the blocks are solved exactly and in fewer sweeps than the ccd
+    ridge = GLM(family=family, lambda_l2=1.0, solver="inv").fit(X, y)
+    ccd = GLM(family=family, lambda_l2=1.0, solver="ccd").fit(X, y)
+    bcd = GLM(family=family, lambda_l2=1.0, groups=groups).fit(X, y)
+    assert bcd.solver_ == "bcd"
+    np.testing.assert_almost_equal(bcd.coef_, ridge.coef_, 5)
+    np.testing.assert_almost_equal(bcd.intercept_, ridge.intercept_, 5)
+    assert bcd.ccd_niter_ < ccd.ccd_niter_
+
+    glasso = GLM(family=family, lambda_group=50.0, groups=groups, compute_cov=True).fit(X, y)
+    assert np.all(glasso.coef_[3:] == 0)
+    assert np.all(glasso.coef_[:3] != 0)
+    assert np.isnan(glasso.bse_[4:]).all()
+    if family == "gaussian":
+        # the degrees of freedom count the intercept and the 3 non zero coefficients
+        np.testing.assert_almost_equal(glasso.dispersion_, glasso.deviance_ / (n - 4))
+
+    with pytest.raises(ValueError):
+        GLM(family=family, groups=groups, solver="inv")
+    with pytest.raises(ValueError):
+        GLM(family=family, groups=groups[1:]).fit(X, y)
+    with pytest.raises(ValueError):
+        GLM(family=family, lambda_group=1000.0)
+
+
+def test_glm_groups_collinear():
+    y, X, true_beta = simulate_supervised_poisson(500, 3)
+    X = np.column_stack([X[:, :1], X])
+    bcd = GLM(family="poisson", groups=[0, 0, 1, 1]).fit(X, y)
+    ccd = GLM(family="poisson", solver="ccd").fit(X, y)
+    np.testing.assert_almost_equal(bcd.predict(X), ccd.predict(X), 5)
+    np.testing.assert_almost_equal(bcd.coef_[0], bcd.coef_[1], 6)
+
+
+def test_glm_bernoulli():
+    y, X, true_beta = simulate_supervised_binomial(500, 4, r=1)
+    bernoulli = GLM(family="bernoulli").fit(X, y)
+    binomial = GLM(family="binomial", r=1).fit(X, y)
+    np.testing.assert_almost_equal(bernoulli.coef_, binomial.coef_, 6)
+    np.testing.assert_almost_equal(bernoulli.predict(X), binomial.predict(X), 6)
+
+
+def test_glm_n_threads():
+    from numba import get_num_threads
+
+    n_threads = get_num_threads()
+    y, X, true_beta = simulate_supervised_poisson(1000, 5)
+    glm = GLM(family="poisson", solver="ccd").fit(X, y)
+    glm_1 = GLM(family="poisson", solver="ccd", n_threads=1).fit(X, y)
+    np.testing.assert_almost_equal(glm.coef_, glm_1.coef_, 8)
+    assert get_num_threads() == n_threads
+
+
+@pytest.mark.parametrize("family", ("poisson", "negativebinomial"))
+@pytest.mark.parametrize("solver", ("inv", "ccd", "ccd_gram"))
+def test_glm_warm_start(family, solver):
+    if family == "poisson":
+        y, X, true_beta = simulate_supervised_poisson(2000, 10)
+    else:
+        y, X, true_beta = simulate_supervised_negative_binomial(2000, 10, r=1)
+    lambda_l1 = 1.0 if solver != "inv" else None
+
+    cold = GLM(family=family, solver=solver, lambda_l1=lambda_l1).fit(X, y)
+    warm = GLM(family=family, solver=solver, lambda_l1=lambda_l1, warm_start=True)
+    warm.fit(X[:1500], y[:1500])
+    warm.fit(X, y)
+    np.testing.assert_almost_equal(cold.coef_, warm.coef_, 6)
+    np.testing.assert_almost_equal(cold.intercept_, warm.intercept_, 6)
+    assert warm.irls_niter_ < cold.irls_niter_
+
+    init = GLM(family=family, solver=solver, lambda_l1=lambda_l1)
+    init.fit(X, y, coef_init=cold.coef_, intercept_init=cold.intercept_)
+    np.testing.assert_almost_equal(cold.coef_, init.coef_, 6)
+    assert init.irls_niter_ <= 2
+
+    # a refit on other features starts cold
+    warm.fit(X[:, :-1], y)
+    cold = GLM(family=family, solver=solver, lambda_l1=lambda_l1).fit(X[:, :-1], y)
+    np.testing.assert_almost_equal(cold.coef_, warm.coef_, 6)
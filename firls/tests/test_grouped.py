@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from firls.grouped import fit_grouped
+from firls.sklearn import GLM
+from firls.tests.simulate import simulate_supervised_glme
+
+
+@pytest.mark.parametrize(
+    "family", ("gaussian", "poisson", "negativebinomial", "binomial")
+)
+@pytest.mark.parametrize("fit_intercept", (False, True))
+def test_fit_grouped(family, fit_intercept):
+    y, X, true_beta = simulate_supervised_glme(600, 4, family)
+    rng = np.random.RandomState(0)
+    groups = rng.choice(["c", "a", "b"], size=600)
+
+    labels, coef, intercept, n_iter = fit_grouped(
+        X, y, groups, family=family, fit_intercept=fit_intercept, lambda_l2=0.5
+    )
+    np.testing.assert_array_equal(labels, ["a", "b", "c"])
+    assert coef.shape == (3, 4)
+    for k, label in enumerate(labels):
+        mask = groups == label
+        glm = GLM(family=family, fit_intercept=fit_intercept, lambda_l2=0.5, solver="inv")
+        glm.fit(X[mask], y[mask])
+        np.testing.assert_almost_equal(coef[k], glm.coef_, 6)
+        np.testing.assert_almost_equal(intercept[k], glm.intercept_, 6)
@@ -0,0 +1,45 @@
+import numpy as np
+import statsmodels.api as sm
+import pytest
+
+from firls.irls import deviance, fit_irls
+from firls.tests.simulate import (
+    simulate_supervised_poisson,
+    simulate_supervised_negative_binomial,
+    simulate_supervised_binomial,
+)
+
+
+@pytest.mark.parametrize("family", ("poisson", "negativebinomial", "binomial"))
+def test_deviance(family):
+    if family == "poisson":
+        y, X, true_beta = simulate_supervised_poisson(100, 4)
+        sm_family = sm.families.Poisson()
+    elif family == "negativebinomial":
+        y, X, true_beta = simulate_supervised_negative_binomial(100, 4, r=1)
+        sm_family = sm.families.NegativeBinomial(alpha=1.0)
+    elif family == "binomial":
+        y, X, true_beta = simulate_supervised_binomial(100, 4, r=1)
+        sm_family = sm.families.Binomial()
+    fit = sm.GLM(y, X, family=sm_family).fit()
+    mu = np.exp(X @ fit.params).reshape(-1, 1)
+    dev = deviance(y.reshape(-1, 1), mu, family, 1.0, 1e-25)
+    np.testing.assert_almost_equal(dev, fit.deviance, 6)
+
+
+@pytest.mark.parametrize("family", ("poisson", "negativebinomial"))
+def test_inexact_newton(family):
+    if family == "poisson":
+        y, X, true_beta = simulate_supervised_poisson(1000, 20)
+    else:
+        y, X, true_beta = simulate_supervised_negative_binomial(1000, 20, r=1)
+    y = y.reshape(-1, 1)
+    w_inv, irls_niter, _, _, _ = fit_irls(
+        X, y, family, True, 0.0, 0.0, None, 1.0, 100, 1e-8, 1e-25, "inv", 1000, 0, False, None, 0.0, None
+    )
+    w_ccd, irls_niter, ccd_niter, _, _ = fit_irls(
+        X, y, family, True, 0.0, 0.0, None, 1.0, 100, 1e-8, 1e-25, "ccd", 1000, 0, False, None, 0.0, None
+    )
+    np.testing.assert_almost_equal(w_ccd, w_inv, 6)
+    # the warm started inexact inner solves need only a few sweeps per irls iteration
+    assert ccd_niter < 5 * irls_niter
@@ -0,0 +1,117 @@
+import asyncio
+import json
+
+import numpy as np
+import pytest
+
+from firls.serving import ScoringService
+from firls.sklearn import GLM
+from firls.tests.simulate import simulate_supervised_poisson
+
+
+def _fit_models():
+    y, X, true_beta = simulate_supervised_poisson(200, 4)
+    model = GLM(family="poisson", fit_intercept=True).fit(X, y)
+    model_bis = GLM(family="poisson", fit_intercept=False).fit(X, y)
+    return X, model, model_bis
+
+
+def _run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_micro_batching():
+    X, model, model_bis = _fit_models()
+
+    async def scenario():
+        service = ScoringService(model, max_batch_size=32, max_latency=0.01)
+        await service.start()
+        predictions = await asyncio.gather(*[service.score(x) for x in X])
+        version = service.swap_model(model_bis)
+        predictions_bis = await asyncio.gather(*[service.submit(x) for x in X[:10]])
+        stats = service.stats()
+        await service.stop()
+        return predictions, version, predictions_bis, stats
+
+    predictions, version, predictions_bis, stats = _run(scenario())
+    np.testing.assert_almost_equal(predictions, model.predict(X))
+    np.testing.assert_almost_equal(
+        [p for p, v in predictions_bis], model_bis.predict(X[:10])
+    )
+    assert all(v == version == 1 for p, v in predictions_bis)
+    assert stats["n_requests"] == len(X) + 10
+    assert stats["n_batches"] < stats["n_requests"]
+    assert stats["p50_latency"] <= stats["p99_latency"]
+
+
+def test_swap_pending_requests():
+    X, model, model_bis = _fit_models()
+
+    async def scenario():
+        # the batch window is long enough for the swap to happen before the worker scores
+        service = ScoringService(model, max_batch_size=1000, max_latency=0.5)
+        await service.start()
+        tasks = [asyncio.ensure_future(service.submit(x)) for x in X]
+        await asyncio.sleep(0)
+        n_pending = len(service._pending)
+        version = service.swap_model(model_bis)
+        results = await asyncio.gather(*tasks)
+        await service.stop()
+        return n_pending, version, results
+
+    n_pending, version, results = _run(scenario())
+    assert n_pending == len(X)
+    assert len(results) == len(X)
+    assert all(v == version == 1 for p, v in results)
+    np.testing.assert_almost_equal([p for p, v in results], model_bis.predict(X))
+
+    # the pending requests were validated against the number of features of the current model
+    model_other = GLM(family="poisson").fit(X[:, :-1], model.predict(X).round())
+    with pytest.raises(ValueError):
+        ScoringService(model).swap_model(model_other)
+
+
+def test_http_server():
+    X, model, model_bis = _fit_models()
+
+    async def request(reader, writer, method, path, payload=None):
+        body = json.dumps(payload).encode() if payload is not None else b""
+        writer.write(
+            "{} {} HTTP/1.1\r\nContent-Length: {}\r\n\r\n".format(
+                method, path, len(body)
+            ).encode()
+            + body
+        )
+        status = int((await reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await reader.readline()
+            if not line.strip():
+                break
+            if line.lower().startswith(b"content-length"):
+                length = int(line.split(b":")[1])
+        return status, json.loads((await reader.readexactly(length)).decode())
+
+    async def scenario():
+        service = ScoringService(model)
+        server = await service.start_server(port=0)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        ok = await request(reader, writer, "POST", "/predict", {"x": X[0].tolist()})
+        bad = await request(reader, writer, "POST", "/predict", {"x": [1.0]})
+        stats = await request(reader, writer, "GET", "/stats")
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        await service.stop()
+        return ok, bad, stats
+
+    ok, bad, stats = _run(scenario())
+    assert ok[0] == 200
+    np.testing.assert_almost_equal(ok[1]["prediction"], model.predict(X[:1])[0])
+    assert bad[0] == 400
+    assert stats[0] == 200 and stats[1]["n_requests"] == 1